@@ -0,0 +1,69 @@
+from abc import ABC, abstractmethod
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, ContextManager, Optional
+
+
+_STOP = object()
+
+
+class BatchWriter(ABC):
+    """Writes queued items to `path` in batches from a background thread.
+
+    Subclasses queue items with `_put`, which never blocks, and implement
+    `_open_writer` and `_write_batch`.
+    """
+
+    thread_name = "batch-writer"
+
+    def __init__(self, path: str, batch_interval: float = 0.05):
+        self.path = path
+        self._batch_interval = batch_interval
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        assert self._thread is None
+        self._thread = threading.Thread(
+            target=self._write_loop, name=self.thread_name, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def _put(self, item: Any):
+        self._queue.put(item)
+
+    @abstractmethod
+    def _open_writer(self) -> ContextManager[Any]:
+        """Opens what `_write_batch` writes to, once, on the writer thread."""
+
+    @abstractmethod
+    def _write_batch(self, writer: Any, batch: list[Any]):
+        """Writes one batch. Errors are logged and the batch is dropped."""
+
+    def _write_loop(self):
+        with self._open_writer() as writer:
+            stopping = False
+            while not stopping:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self._batch_interval
+                while (remaining := deadline - time.monotonic()) > 0:
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+
+                if _STOP in batch:
+                    stopping = True
+                    batch = [e for e in batch if e is not _STOP]
+                try:
+                    self._write_batch(writer, batch)
+                except (OSError, TypeError, ValueError, sqlite3.Error):
+                    logging.exception(f"Failed to write to {self.path}")
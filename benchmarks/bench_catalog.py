@@ -0,0 +1,77 @@
+"""Startup cost of the challenge catalog from 100 to 1,000,000 rows.
+
+Compares parsing the CSV into Challenge objects (the old import-time path)
+with compiling it once and then opening the cached, memory-mapped catalog,
+which is what every later startup does. "first draw" is building a game's
+shuffle bag and drawing the first cycle from the mapped catalog. "weighted"
+is the same with a weighted bag, and "next game" is that again for a second
+game over the same pool, which reuses the cached alias table.
+
+    python benchmarks/bench_catalog.py [max_rows]
+"""
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import CACHE_SUFFIX, open_challenges, parse_challenges  # noqa: E402
+from sampler import ChallengePool, build_bag  # noqa: E402
+
+
+ROW_COUNTS = [100, 1_000, 10_000, 100_000, 1_000_000]
+
+
+def write_csv(path: str, rows: int):
+    with open(path, "w", newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["title", "description", "category", "difficulty", "weight"])
+        for i in range(rows):
+            writer.writerow([f"Challenge {i}", f"Do the thing number {i} before anyone else does",
+                             f"category {i % 20}", ("easy", "medium", "hard")[i % 3], 1 + i % 5])
+
+
+def timed(f, *args):
+    start = time.perf_counter()
+    result = f(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    max_rows = int(sys.argv[1]) if len(sys.argv) > 1 else ROW_COUNTS[-1]
+    print(f"{'rows':>9} | {'parse csv':>10} | {'compile':>10} | {'open cached':>11} | {'first draw':>10} | "
+          f"{'weighted':>10} | {'next game':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in ROW_COUNTS:
+            if rows > max_rows:
+                break
+            path = os.path.join(tmp, f"challenges_{rows}.csv")
+            write_csv(path, rows)
+
+            with open(path, newline='') as f:
+                _, parse_ms = timed(parse_challenges, io.StringIO(f.read(), newline=''), path)
+            _, compile_ms = timed(open_challenges, path)
+            compiled, open_ms = timed(open_challenges, path)
+
+            def first_draw():
+                return build_bag(ChallengePool(compiled)).draw_many(3)
+            _, draw_ms = timed(first_draw)
+
+            pool = ChallengePool(compiled)
+
+            def weighted_draw():
+                return build_bag(pool, weighted=True).draw_many(3)
+            _, weighted_ms = timed(weighted_draw)
+            _, next_ms = timed(weighted_draw)
+
+            print(f"{rows:>9} | {parse_ms:>8.2f}ms | {compile_ms:>8.2f}ms | {open_ms:>9.3f}ms | {draw_ms:>8.3f}ms | "
+                  f"{weighted_ms:>8.2f}ms | {next_ms:>8.3f}ms")
+            del compiled, pool
+            os.remove(path + CACHE_SUFFIX)
+
+
+if __name__ == "__main__":
+    main()
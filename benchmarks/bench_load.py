@@ -0,0 +1,240 @@
+"""Headless load simulation of many concurrent games against a fake Discord.
+
+Drives DiscordSnakeGame end to end: concurrent joins, game starts, a burst
+of "Complete Challenge" clicks right after every broadcast, and the end of
+every game. Reports p50/p99 latencies, cycle tick lateness and how long
+the shared teardown takes to clean up after the games. Game i is started
+with seed --seed + i, so reruns with the same seed see the same challenges.
+
+With --recover, every game is journaled and the bot is "killed" after the
+last cycle: the games are stopped without ending, the journal is replayed
+and all of them are restored at once, as on_ready does after a restart.
+The restored games then play one more cycle before they end.
+
+    python benchmarks/bench_load.py --games 1000 --players 10 --clicks 20
+    python benchmarks/bench_load.py --games 500 --recover
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_discord import FakeDiscord, FakeInteraction  # noqa: E402
+
+import catalog  # noqa: E402
+from journal import GameRecord, Journal, replay  # noqa: E402
+from outbox import Outbox  # noqa: E402
+from snake_bot import DiscordSnakeGame  # noqa: E402
+from teardown import Teardown  # noqa: E402
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = defaultdict(list)
+
+    async def time(self, name: str, awaitable: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return await awaitable
+        finally:
+            self.samples[name].append(time.perf_counter() - start)
+
+    def report(self):
+        print(f"{'operation':<22} {'count':>7} {'p50':>10} {'p99':>10} {'max':>10}")
+        for name, samples in self.samples.items():
+            print(f"{name:<22} {len(samples):>7} {percentile(samples, 50):>8.1f}ms "
+                  f"{percentile(samples, 99):>8.1f}ms {max(samples) * 1000:>8.1f}ms")
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000
+
+
+def write_catalog(directory: str, rows: int) -> str:
+    path = os.path.join(directory, "challenges.csv")
+    with open(path, "w") as f:
+        f.write("title,description\n")
+        for i in range(rows):
+            f.write(f"Challenge {i},Description {i}\n")
+    return path
+
+
+class SimulatedGame:
+    def __init__(self, backend: FakeDiscord, recorder: Recorder, args: argparse.Namespace,
+                 outbox: Outbox, teardown: Teardown, seed: int, journal: Optional[Journal] = None):
+        self.backend = backend
+        self.recorder = recorder
+        self.args = args
+        self.outbox = outbox
+        self.teardown = teardown
+        self.seed = seed
+        self.journal = journal
+        self.guild = backend.guild(args.teams)
+        self.channel = self.guild.text_channel()
+        self.players = [self.guild.member() for _ in range(args.players)]
+        self.storms: list[asyncio.Task] = []
+
+    async def setup(self):
+        self.thread = await self.channel.create_thread(name="Snake General")
+        game_journal = None
+        if self.journal is not None:
+            game_journal = self.journal.for_game(self.thread.id)
+            game_journal.record("game_created", guild_id=self.guild.id, channel_id=self.channel.id,
+                                thread_id=self.thread.id, team_role_ids=[r.id for r in self.guild.roles])
+        self.game = DiscordSnakeGame(self.thread, self.thread.id, self.guild.roles, game_journal)
+        self.game._outbox = self.outbox
+        self.game._teardown = self.teardown
+        self.game._settings.cycle_length = self.args.cycle_length
+        self.game._settings.warning_time = self.args.warning_time
+
+        send_freezes = self.game._send_freezes
+
+        async def timed_send_freezes(*args: Any):
+            await self.recorder.time("_send_freezes", send_freezes(*args))
+
+        self.game._send_freezes = timed_send_freezes  # type: ignore[method-assign]
+
+        broadcast = self.game._broadcast_challenges
+
+        async def timed_broadcast(cycle_id: int):
+            await self.recorder.time("_broadcast_challenges", broadcast(cycle_id))
+            self.storms.append(asyncio.create_task(self.click_storm(cycle_id)))
+
+        self.game._broadcast_challenges = timed_broadcast  # type: ignore[method-assign]
+
+    async def join(self, player_index: int):
+        player = self.players[player_index]
+        ctx: Any = FakeInteraction(self.backend, player, self.thread)
+        await self.recorder.time("join_game", self.game.join_game(ctx, player_index % self.args.teams + 1))
+
+    async def start(self):
+        ctx: Any = FakeInteraction(self.backend, self.players[0], self.thread)
+        await self.recorder.time("start_game", self.game.start_game(ctx, self.seed))
+
+    async def click_storm(self, cycle_id: int):
+        async def click():
+            interaction: Any = FakeInteraction(self.backend, random.choice(self.players), self.thread)
+            challenge_id = random.randrange(self.game._settings.num_challenges)
+            await self.recorder.time("_complete_challenge",
+                                     self.game._complete_challenge(interaction, challenge_id, cycle_id))
+
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(self.args.clicks):
+                tg.create_task(click())
+
+    def crash(self):
+        """Stops the game without ending it, as if the bot's process had been killed."""
+        self.game._game._timer.cancel_all()
+        for task in (self.game._event_task, self.game._warning_task, *self.storms):
+            if task is not None:
+                task.cancel()
+        self.storms = []
+
+    async def restore(self, record: GameRecord, journal: Journal):
+        game = await DiscordSnakeGame.restore(self.backend.client(), record, journal.for_game(record.game_id))
+        game._outbox = self.outbox
+        game._teardown = self.teardown
+        self.game = game
+
+    async def end(self):
+        ctx: Any = FakeInteraction(self.backend, self.players[0], self.thread)
+        await self.recorder.time("end_game", self.game.end_game(ctx))
+        await asyncio.gather(*self.storms)
+
+
+async def run(args: argparse.Namespace):
+    backend = FakeDiscord.uniform(args.min_latency / 1000, args.max_latency / 1000, seed=args.seed)
+    recorder = Recorder()
+    if args.rate_limit:
+        outbox = Outbox()
+        teardown = Teardown()
+    else:
+        outbox = Outbox(channel_rate=1_000_000, global_rate=1_000_000)
+        teardown = Teardown(rate=1_000_000)
+
+    journal = None
+    if args.recover:
+        journal = Journal(os.path.join(args.tmp, "journal.jsonl"))
+        journal.start()
+    games = [SimulatedGame(backend, recorder, args, outbox, teardown, args.seed + i, journal)
+             for i in range(args.games)]
+    await asyncio.gather(*(g.setup() for g in games))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(g.join(i) for g in games for i in range(args.players)))
+    print(f"Joined {args.games * args.players} players in {time.perf_counter() - start:.2f}s")
+
+    await asyncio.gather(*(g.start() for g in games))
+    await asyncio.sleep(args.cycles * args.cycle_length + args.warning_time)
+    if journal is not None:
+        journal = await recover(games, journal, recorder, args)
+    await asyncio.gather(*(g.end() for g in games))
+    if journal is not None:
+        journal.close()
+    start = time.perf_counter()
+    await teardown.join()
+    print(f"Teardown finished {time.perf_counter() - start:.2f}s after the last game ended")
+
+    lateness = [t for g in games for t in g.game._game.tick_lateness]
+    if lateness:
+        recorder.samples["tick lateness"] = lateness
+    recorder.report()
+    # Identical for runs with the same --seed and catalog
+    schedules = hashlib.sha256(b"".join(g.game._game._schedule.indices.tobytes() for g in games))
+    print(f"Schedules: {schedules.hexdigest()[:16]}")
+    print("API calls:", ", ".join(f"{k}={v}" for k, v in backend.calls.most_common()))
+
+
+async def recover(games: list[SimulatedGame], journal: Journal, recorder: Recorder,
+                  args: argparse.Namespace) -> Journal:
+    for g in games:
+        g.crash()
+    journal.close()
+
+    start = time.perf_counter()
+    records = replay(journal.read())
+    journal = Journal(journal.path)
+    journal.start()
+    by_thread = {g.thread.id: g for g in games}
+    await asyncio.gather(*(recorder.time("restore", by_thread[r.thread_id].restore(r, journal))
+                           for r in records.values()))
+    print(f"Recovered {len(records)} games in {time.perf_counter() - start:.2f}s")
+    await asyncio.sleep(args.cycle_length)
+    return journal
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=10)
+    parser.add_argument("--teams", type=int, default=2)
+    parser.add_argument("--clicks", type=int, default=20, help="Clicks per game after every broadcast")
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--cycle-length", type=float, default=3)
+    parser.add_argument("--warning-time", type=int, default=1)
+    parser.add_argument("--min-latency", type=float, default=20, help="Fake API latency in ms")
+    parser.add_argument("--max-latency", type=float, default=80, help="Fake API latency in ms")
+    parser.add_argument("--rate-limit", action="store_true", help="Use the outbox's Discord rate limits")
+    parser.add_argument("--recover", action="store_true",
+                        help="Restart the bot after the last cycle and restore every game from the journal")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        args.tmp = tmp
+        catalog.load_catalog(write_catalog(tmp, 1000))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Gateway memory of the bot's profiles in a simulated large guild.
+
+Feeds a pycord connection state the events Discord would send for a guild
+with --members members, filtered by each profile's intents:
+GUILD_CREATE, member chunks when the members intent is on, --messages
+chat messages when the guild messages intent is on, and --clicks button
+interactions, which arrive regardless of intents. Reports the memory
+retained by the cache afterwards and the time taken to generate and
+process the events.
+
+    python benchmarks/bench_memory.py --members 100000
+"""
+import argparse
+import asyncio
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+from discord.state import ChunkRequest  # noqa: E402
+
+from snake_bot import gateway_options  # noqa: E402
+
+GUILD_ID = 1 << 50
+CHANNEL_ID = GUILD_ID + 1
+THREAD_ID = GUILD_ID + 2
+ROLE_IDS = [GUILD_ID + 10, GUILD_ID + 11]
+BOT_ID = GUILD_ID + 100
+FIRST_MEMBER_ID = GUILD_ID + 1000
+CHUNK_SIZE = 1000
+
+
+def user_payload(user_id: int) -> dict[str, Any]:
+    return {"id": str(user_id), "username": f"user{user_id}", "discriminator": "0",
+            "global_name": None, "avatar": None}
+
+
+def member_payload(user_id: int) -> dict[str, Any]:
+    return {"user": user_payload(user_id), "roles": [], "joined_at": "2024-01-01T00:00:00+00:00",
+            "deaf": False, "mute": False, "flags": 0}
+
+
+def guild_payload(members: int) -> dict[str, Any]:
+    return {
+        "id": str(GUILD_ID), "name": "Large guild", "owner_id": str(FIRST_MEMBER_ID),
+        "member_count": members, "large": True, "features": [], "emojis": [], "stickers": [],
+        "roles": [{"id": str(i), "name": f"Team {n + 1}", "permissions": "0", "position": n + 1,
+                   "color": 0, "colors": {"primary_color": 0}, "hoist": False, "managed": False, "mentionable": True}
+                  for n, i in enumerate(ROLE_IDS)],
+        "channels": [{"id": str(CHANNEL_ID), "type": 0, "name": "snake", "position": 0,
+                      "permission_overwrites": []}],
+        "threads": [{"id": str(THREAD_ID), "type": 11, "name": "Snake General", "parent_id": str(CHANNEL_ID),
+                     "owner_id": str(BOT_ID), "guild_id": str(GUILD_ID),
+                     "thread_metadata": {"archived": False, "auto_archive_duration": 1440,
+                                         "archive_timestamp": "2024-01-01T00:00:00+00:00", "locked": False}}],
+        # Large guilds only come with the bot itself
+        "members": [member_payload(BOT_ID)],
+        "voice_states": [], "presences": [],
+    }
+
+
+def message_payload(message_id: int, user_id: int) -> dict[str, Any]:
+    return {
+        "id": str(message_id), "channel_id": str(CHANNEL_ID), "guild_id": str(GUILD_ID),
+        "author": user_payload(user_id), "member": {k: v for k, v in member_payload(user_id).items() if k != "user"},
+        "content": "hello " * 10, "timestamp": "2024-01-01T00:00:00+00:00", "edited_timestamp": None,
+        "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [],
+        "attachments": [], "embeds": [], "pinned": False, "type": 0,
+    }
+
+
+def interaction_payload(interaction_id: int, user_id: int) -> dict[str, Any]:
+    return {
+        "id": str(interaction_id), "application_id": str(BOT_ID), "type": 3, "token": "x", "version": 1,
+        "guild_id": str(GUILD_ID), "channel_id": str(THREAD_ID),
+        "member": {**member_payload(user_id), "permissions": "0"},
+        "data": {"custom_id": "snake:0:0:0", "component_type": 2},
+        "message": message_payload(interaction_id, BOT_ID) | {"channel_id": str(THREAD_ID)},
+    }
+
+
+async def measure(options: dict[str, Any], args: argparse.Namespace) -> tuple[int, float, int, int]:
+    bot = discord.Bot(**options)
+    state = bot._connection
+    intents = state._intents
+    rng = random.Random(args.seed)
+    member_ids = range(FIRST_MEMBER_ID, FIRST_MEMBER_ID + args.members)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+
+    state._add_guild_from_data(guild_payload(args.members))
+    if intents.members and state._chunk_guilds:
+        # What chunk_guild does when the guild becomes available at startup
+        request = ChunkRequest(GUILD_ID, asyncio.get_running_loop(), state._get_guild,
+                               cache=state.member_cache_flags.joined)
+        state._chunk_requests[request.nonce] = request
+        for i in range(0, args.members, CHUNK_SIZE):
+            state.parse_guild_members_chunk({
+                "guild_id": str(GUILD_ID), "nonce": request.nonce, "chunk_index": i // CHUNK_SIZE,
+                "chunk_count": -(-args.members // CHUNK_SIZE),
+                "members": [member_payload(m) for m in member_ids[i:i + CHUNK_SIZE]]})
+    if intents.guild_messages:
+        for i in range(args.messages):
+            state.parse_message_create(message_payload(GUILD_ID + 10_000_000 + i, rng.choice(member_ids)))
+    for i in range(args.clicks):
+        state.parse_interaction_create(interaction_payload(GUILD_ID + 20_000_000 + i, rng.choice(member_ids)))
+
+    elapsed = time.perf_counter() - start
+    # Let the dispatched listener tasks finish so only the caches remain
+    await asyncio.sleep(0.1)
+    gc.collect()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    guild = state._get_guild(GUILD_ID)
+    assert guild is not None
+    messages = len(state._messages) if state._messages is not None else 0
+    return retained, elapsed, len(guild._members), messages
+
+
+async def run(args: argparse.Namespace):
+    # Bots that need member lists usually add the members intent, for reference
+    intents = discord.Intents.default()
+    intents.members = True
+    profiles = [
+        ("full", gateway_options("full")),
+        ("full+members", {**gateway_options("full"), "intents": intents}),
+        ("lean", gateway_options("lean")),
+    ]
+
+    print(f"{'profile':<14} {'retained':>10} {'time':>9} {'members':>9} {'messages':>9}")
+    for name, options in profiles:
+        retained, elapsed, members, messages = await measure(options, args)
+        print(f"{name:<14} {retained / 2**20:>8.1f}MB {elapsed:>8.2f}s {members:>9} {messages:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument("--messages", type=int, default=5_000, help="Chat messages sent in the guild")
+    parser.add_argument("--clicks", type=int, default=5_000, help="Button interactions")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Event-loop wakeups per second for per-game sleepers vs the shared scheduler.
+
+Each simulated game ticks once a second with a random phase, like the
+countdown loops and cycle timers of concurrently running games.
+
+    python benchmarks/bench_scheduler.py [seconds]
+"""
+import asyncio
+import os
+import random
+import selectors
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import Scheduler  # noqa: E402
+
+
+GAME_COUNTS = [10, 100, 1000, 5000]
+
+
+class CountingSelector(selectors.DefaultSelector):
+    def __init__(self):
+        super().__init__()
+        self.wakeups = 0
+
+    def select(self, timeout=None):
+        self.wakeups += 1
+        return super().select(timeout)
+
+
+async def _sleeper_game(duration: float):
+    await asyncio.sleep(random.random())
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        await asyncio.sleep(1)
+
+
+async def _scheduled_game(scheduler: Scheduler, duration: float):
+    start = scheduler.now() + random.random()
+    for i in range(int(duration) + 1):
+        await scheduler.sleep_until(start + i)
+
+
+async def _run_sleepers(games: int, duration: float):
+    await asyncio.gather(*(_sleeper_game(duration) for _ in range(games)))
+
+
+async def _run_scheduled(games: int, duration: float):
+    scheduler = Scheduler()
+    await asyncio.gather(*(_scheduled_game(scheduler, duration) for _ in range(games)))
+
+
+def measure(main, games: int, duration: float) -> tuple[float, float]:
+    selector = CountingSelector()
+    loop = asyncio.SelectorEventLoop(selector)
+    try:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        loop.run_until_complete(main(games, duration))
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+    finally:
+        loop.close()
+    return selector.wakeups / wall, cpu / wall
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+    print(f"{'games':>6} | {'sleepers wakeups/s':>18} {'cpu':>6} | {'scheduler wakeups/s':>19} {'cpu':>6}")
+    for games in GAME_COUNTS:
+        s_wakeups, s_cpu = measure(_run_sleepers, games, duration)
+        w_wakeups, w_cpu = measure(_run_scheduled, games, duration)
+        print(f"{games:>6} | {s_wakeups:>18.1f} {s_cpu:>6.1%} | {w_wakeups:>19.1f} {w_cpu:>6.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""Challenge search index build time and lookup latency.
+
+Builds the index over a --rows catalog, rebuilds it after editing 1% of
+the rows, then times --queries lookups of each kind: short title prefixes
+(what autocomplete sends for the first keystrokes), title substrings,
+description substrings and queries that match nothing. The linear scan is
+the same search without the index.
+
+    python benchmarks/bench_search.py --rows 100000
+"""
+import argparse
+import csv
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog  # noqa: E402
+from search import SearchIndex, normalize  # noqa: E402
+
+SYLLABLES = "ka ri so mel an tor vi len du pa ros ne fi gal om ber tu lix".split()
+
+
+def write_csv(path: str, rows: list[tuple[str, str]]):
+    with open(path, "w", newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(["title", "description"])
+        writer.writerows(rows)
+
+
+def make_words(n: int, rng: random.Random) -> list[str]:
+    return ["".join(rng.choices(SYLLABLES, k=rng.randint(2, 4))) for _ in range(n)]
+
+
+def make_rows(n: int, words: list[str], rng: random.Random) -> list[tuple[str, str]]:
+    # Word frequencies roughly follow Zipf's law, like in real text
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+
+    def text(k: int) -> str:
+        return " ".join(rng.choices(words, weights, k=k))
+
+    return [(f"{text(3).title()} {i}", f"{text(6).capitalize()} before the {text(2)}") for i in range(n)]
+
+
+def substring(text: str, length: int, rng: random.Random) -> str:
+    start = rng.randrange(max(1, len(text) - length))
+    return text[start:start + length]
+
+
+def percentiles(samples: list[float]) -> str:
+    samples.sort()
+    p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+    return f"{statistics.median(samples) * 1e6:>8.1f}us {p99 * 1e6:>8.1f}us"
+
+
+def linear_search(titles: list[str], descriptions: list[str], query: str, limit: int = 25) -> list[int]:
+    query = normalize(query)
+    found = [i for i, t in enumerate(titles) if query in normalize(t)][:limit]
+    if len(found) < limit:
+        found += [i for i, d in enumerate(descriptions) if query in normalize(d)][:limit - len(found)]
+    return found
+
+
+def run(args: argparse.Namespace):
+    rng = random.Random(args.seed)
+    words = make_words(args.words, rng)
+    rows = make_rows(args.rows, words, rng)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "challenges.csv")
+        write_csv(path, rows)
+        first = catalog.load_catalog(path)
+
+        start = time.perf_counter()
+        index = SearchIndex(first)
+        print(f"Indexed {args.rows} challenges in {time.perf_counter() - start:.2f}s")
+
+        for i in rng.sample(range(args.rows), args.rows // 100):
+            rows[i] = (rows[i][0] + " edited", rows[i][1])
+        write_csv(path, rows)
+        second = catalog.load_catalog(path)
+        start = time.perf_counter()
+        index = SearchIndex(second, index)
+        print(f"Re-indexed after editing 1% of the rows in {time.perf_counter() - start:.2f}s")
+
+        queries = {
+            "title prefix": [rng.choice(words)[:rng.randint(1, 2)] for _ in range(args.queries)],
+            "title substring": [substring(rng.choice(rows)[0], rng.randint(3, 12), rng) for _ in range(args.queries)],
+            "description substring": [substring(rng.choice(rows)[1], rng.randint(3, 12), rng)
+                                      for _ in range(args.queries)],
+            "exact title": [rows[rng.randrange(args.rows)][0] for _ in range(args.queries)],
+            "no match": [f"zq{rng.randrange(1000)}x" for _ in range(args.queries)],
+        }
+        print(f"{'query':<22} {'p50':>10} {'p99':>10}")
+        for name, batch in queries.items():
+            samples = []
+            for q in batch:
+                start = time.perf_counter()
+                index.search(q)
+                samples.append(time.perf_counter() - start)
+            print(f"{name:<22} {percentiles(samples)}")
+
+        titles = [r[0] for r in rows]
+        descriptions = [r[1] for r in rows]
+        samples = []
+        for q in queries["no match"][:20]:
+            start = time.perf_counter()
+            linear_search(titles, descriptions, q)
+            samples.append(time.perf_counter() - start)
+        print(f"{'no match (linear)':<22} {percentiles(samples)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=1_000)
+    parser.add_argument("--words", type=int, default=5_000, help="Vocabulary size")
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
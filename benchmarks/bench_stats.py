@@ -0,0 +1,79 @@
+"""Statistics store throughput and query latency with millions of completions.
+
+Records --completions completions spread over --guilds guilds through the
+batched writer, then times the leaderboard and solve time queries, which read
+the precomputed totals, against the same aggregates computed from the raw
+completions table.
+
+    python benchmarks/bench_stats.py --completions 2000000
+"""
+import argparse
+import contextlib
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stats import StatsStore  # noqa: E402
+
+
+def timed(f, *args, repeat: int = 20) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f(*args)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def run(args: argparse.Namespace):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = StatsStore(os.path.join(tmp, "stats.db"))
+        store.start()
+        games = [store.for_game(g, g % args.guilds) for g in range(args.completions // 100 + 1)]
+
+        start = time.perf_counter()
+        for i in range(args.completions):
+            game = games[i // 100]
+            if i % 100 == 0:
+                game.game_started()
+            game.challenge_completed(i % 100, f"Challenge {rng.randrange(args.challenges)}", i % 2,
+                                     rng.randrange(args.players), rng.uniform(1, 120))
+        recorded = time.perf_counter() - start
+        store.close()
+        flushed = time.perf_counter() - start
+        print(f"Recorded {args.completions} completions in {recorded:.2f}s "
+              f"({recorded / args.completions * 1e6:.1f}us each on the caller), written after {flushed:.2f}s")
+
+        guild_id = 0
+        title = "Challenge 0"
+        print(f"{'query':<28} {'p50':>10}")
+        print(f"{'leaderboard':<28} {timed(store.leaderboard, guild_id) * 1000:>8.2f}ms")
+        print(f"{'solve times (one)':<28} {timed(store.challenge_stats, guild_id, title) * 1000:>8.2f}ms")
+        print(f"{'solve times (top)':<28} {timed(store.challenge_stats, guild_id) * 1000:>8.2f}ms")
+
+        def raw_leaderboard():
+            with contextlib.closing(store._connect()) as db:
+                db.execute("SELECT player_id, count(*), avg(solve_time) FROM completions WHERE guild_id = ? "
+                           "GROUP BY player_id ORDER BY count(*) DESC LIMIT 10", (guild_id,)).fetchall()
+
+        print(f"{'leaderboard without totals':<28} {timed(raw_leaderboard, repeat=3) * 1000:>8.2f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--completions", type=int, default=2_000_000)
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--players", type=int, default=50_000)
+    parser.add_argument("--challenges", type=int, default=1_000)
+    parser.add_argument("--seed", type=int, default=0)
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""In-process stand-ins for the parts of Discord that the bot touches.
+
+Threads, channels and members subclass the real pycord types so the bot's
+isinstance checks pass, but none of them talk to Discord. Every API call
+sleeps for a latency drawn from the `FakeDiscord` it belongs to and is
+counted by operation.
+"""
+import asyncio
+from collections import Counter
+from collections.abc import Callable
+import contextlib
+import itertools
+import random
+from typing import Any, Optional
+
+import discord
+
+
+class FakeDiscord:
+    def __init__(self, latency: Callable[[], float] = lambda: 0.0):
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self.guilds: list[FakeGuild] = []
+        self._ids = itertools.count(1 << 40)
+
+    @classmethod
+    def uniform(cls, low: float, high: float, seed: Optional[int] = None) -> "FakeDiscord":
+        rng = random.Random(seed)
+        return cls(lambda: rng.uniform(low, high))
+
+    def next_id(self) -> int:
+        return next(self._ids)
+
+    async def call(self, operation: str):
+        self.calls[operation] += 1
+        delay = self.latency()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        else:
+            await asyncio.sleep(0)
+
+    def guild(self, num_roles: int = 2) -> "FakeGuild":
+        guild = FakeGuild(self, num_roles)
+        self.guilds.append(guild)
+        return guild
+
+    def client(self) -> "FakeClient":
+        return FakeClient(self)
+
+
+class FakeClient:
+    """Looks up the channels and threads of every guild of a `FakeDiscord`, like a bot's client."""
+
+    def __init__(self, backend: FakeDiscord):
+        self._backend = backend
+
+    def get_channel(self, channel_id: int) -> Any:
+        for guild in self._backend.guilds:
+            channel = guild.channels_by_id.get(channel_id)
+            if channel is not None:
+                return channel
+        return None
+
+    async def fetch_channel(self, channel_id: int) -> Any:
+        await self._backend.call("fetch_channel")
+        channel = self.get_channel(channel_id)
+        if channel is None:
+            raise KeyError(channel_id)
+        return channel
+
+
+class FakeRole:
+    def __init__(self, backend: FakeDiscord, name: str):
+        self.id = backend.next_id()
+        self.name = name
+
+    @property
+    def mention(self) -> str:
+        return f"<@&{self.id}>"
+
+
+class FakeMember(discord.Member):
+    def __init__(self, backend: FakeDiscord, guild: "FakeGuild"):
+        self._backend = backend
+        self._fake_id = backend.next_id()
+        self.guild = guild
+        self.fake_roles: set[int] = set()
+
+    @property
+    def id(self) -> int:  # type: ignore[override]
+        return self._fake_id
+
+    @property
+    def mention(self) -> str:  # type: ignore[override]
+        return f"<@{self._fake_id}>"
+
+    def __hash__(self) -> int:
+        return self._fake_id
+
+    async def add_roles(self, *roles: Any, **_: Any):
+        await self._backend.call("add_roles")
+        self.fake_roles.update(r.id for r in roles)
+
+    async def remove_roles(self, *roles: Any, **_: Any):
+        await self._backend.call("remove_roles")
+        self.fake_roles.difference_update(r.id for r in roles)
+
+
+class FakeMessage:
+    def __init__(self, backend: FakeDiscord, channel: "FakeThread", content: Optional[str], view: Any):
+        self._backend = backend
+        self.id = backend.next_id()
+        self.channel = channel
+        self.content = content
+        self.view = view
+        self.deleted = False
+
+    async def edit(self, content: Any = ..., view: Any = ..., **_: Any) -> "FakeMessage":
+        await self._backend.call("edit")
+        if content is not ...:
+            self.content = content
+        if view is not ...:
+            self.view = view
+        return self
+
+    async def delete(self, **_: Any):
+        await self._backend.call("delete")
+        self.deleted = True
+
+
+class FakeThread(discord.Thread):
+    def __init__(self, backend: FakeDiscord, guild: "FakeGuild", parent: "FakeTextChannel", name: str):
+        self._backend = backend
+        self.id = backend.next_id()
+        self.guild = guild  # type: ignore[assignment]
+        self.name = name
+        self._fake_parent = parent
+        self.messages: list[FakeMessage] = []
+        self.user_ids: set[int] = set()
+        self.fake_archived = False
+
+    @property
+    def parent(self) -> "FakeTextChannel":  # type: ignore[override]
+        return self._fake_parent
+
+    def __hash__(self) -> int:
+        return self.id
+
+    async def send(self, content: Optional[str] = None, *, view: Any = None, **_: Any) -> FakeMessage:  # type: ignore[override]
+        await self._backend.call("send")
+        message = FakeMessage(self._backend, self, content, view)
+        if view is not None:
+            view.message = message
+        self.messages.append(message)
+        return message
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:  # type: ignore[override]
+        # Like the real one, this makes no API call
+        message = next((m for m in self.messages if m.id == message_id), None)
+        if message is None:
+            message = FakeMessage(self._backend, self, None, None)
+            message.id = message_id
+        return message
+
+    async def add_user(self, user: Any):
+        await self._backend.call("add_user")
+        self.user_ids.add(user.id)
+
+    async def archive(self, locked: bool = False):
+        await self._backend.call("archive")
+        self.fake_archived = True
+
+    def typing(self) -> contextlib.AbstractAsyncContextManager:  # type: ignore[override]
+        return contextlib.nullcontext()  # type: ignore[return-value]
+
+
+class FakeTextChannel(discord.TextChannel):
+    def __init__(self, backend: FakeDiscord, guild: "FakeGuild"):
+        self._backend = backend
+        self.id = backend.next_id()
+        self.guild = guild  # type: ignore[assignment]
+        self.threads_created: list[FakeThread] = []
+
+    def __hash__(self) -> int:
+        return self.id
+
+    async def create_thread(self, *, name: str, **_: Any) -> FakeThread:  # type: ignore[override]
+        await self._backend.call("create_thread")
+        thread = FakeThread(self._backend, self.guild, self, name)
+        self.threads_created.append(thread)
+        self.guild.channels_by_id[thread.id] = thread
+        return thread
+
+
+class FakeGuild:
+    def __init__(self, backend: FakeDiscord, num_roles: int):
+        self._backend = backend
+        self.id = backend.next_id()
+        self.roles = [FakeRole(backend, f"Team {i + 1}") for i in range(num_roles)]
+        self.members_by_id: dict[int, FakeMember] = {}
+        self.channels_by_id: dict[int, Any] = {}
+
+    def text_channel(self) -> FakeTextChannel:
+        channel = FakeTextChannel(self._backend, self)
+        self.channels_by_id[channel.id] = channel
+        return channel
+
+    def member(self) -> FakeMember:
+        member = FakeMember(self._backend, self)
+        self.members_by_id[member.id] = member
+        return member
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        return next((r for r in self.roles if r.id == role_id), None)
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        return self.members_by_id.get(user_id)
+
+    async def fetch_member(self, user_id: int) -> FakeMember:
+        await self._backend.call("fetch_member")
+        return self.members_by_id[user_id]
+
+    async def create_role(self, *, name: str, **_: Any) -> FakeRole:
+        await self._backend.call("create_role")
+        role = FakeRole(self._backend, name)
+        self.roles.append(role)
+        return role
+
+
+class _FakeResponse:
+    def __init__(self, interaction: "FakeInteraction"):
+        self._interaction = interaction
+
+    async def send_message(self, content: Optional[str] = None, **kwargs: Any):
+        await self._interaction.respond(content, **kwargs)
+
+    async def defer(self, **_: Any):
+        await self._interaction._backend.call("defer")
+        self._interaction.deferred = True
+
+
+class FakeInteraction:
+    """Stands in for both `discord.Interaction` and `discord.ApplicationContext`."""
+
+    def __init__(self, backend: FakeDiscord, user: FakeMember, channel: Any):
+        self._backend = backend
+        self.user = user
+        self.channel = channel
+        self.guild = user.guild
+        self.response = _FakeResponse(self)
+        self.responses: list[Optional[str]] = []
+        self.deferred = False
+
+    async def respond(self, content: Optional[str] = None, **_: Any):
+        await self._backend.call("respond")
+        self.responses.append(content)
+
+    async def defer(self, **_: Any):
+        await self.response.defer()
+
+
+FakeApplicationContext = FakeInteraction
@@ -0,0 +1,346 @@
+from array import array
+import asyncio
+from collections.abc import Callable, Sequence
+import contextlib
+import csv
+from dataclasses import dataclass
+import hashlib
+import io
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from typing import Any, Optional, overload
+
+from sampler import ChallengePool
+
+
+CHALLENGES_PATH = "challenges.csv"
+CACHE_SUFFIX = ".cache"
+
+
+class CatalogError(ValueError):
+    pass
+
+
+@dataclass
+class Challenge:
+    title: str
+    description: str
+    category: str = ""
+    difficulty: str = ""
+    weight: float = 1.0
+
+
+@dataclass(frozen=True)
+class Catalog:
+    """An immutable snapshot of the challenges. Reloading replaces it as a whole."""
+    version: int
+    pool: ChallengePool
+    mtime: float = 0
+    # SHA-256 of the source file, which identifies the same challenges across restarts
+    digest: str = ""
+
+    def __len__(self) -> int:
+        return len(self.pool)
+
+
+_catalog = Catalog(0, ChallengePool([]))
+_loaded = False
+# Held while a catalog is built on the first access, so that callers on
+# other threads wait for that load instead of starting their own
+_load_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    """Returns the current catalog, loading it the first time it is needed.
+
+    The first load parses the whole file, so code on the event loop should
+    await `ensure_catalog` first.
+    """
+    global _loaded
+    if not _loaded:
+        with _load_lock:
+            if not _loaded:
+                try:
+                    _swap(_build_catalog(CHALLENGES_PATH, _catalog.version + 1))
+                except (OSError, CatalogError) as e:
+                    # Keep the empty catalog rather than retrying on every cycle
+                    _loaded = True
+                    logging.error(f"Failed to load challenges: {e}")
+    return _catalog
+
+
+async def ensure_catalog() -> Catalog:
+    """Returns the current catalog, loading it in a worker thread the first time."""
+    if _loaded:
+        return _catalog
+    return await asyncio.to_thread(get_catalog)
+
+
+def loaded_catalog() -> Optional[Catalog]:
+    """Returns the current catalog if it was loaded, without loading it."""
+    return _catalog if _loaded else None
+
+
+def parse_challenges(f: io.TextIOBase, path: str) -> list[Challenge]:
+    challenges = []
+    reader = csv.DictReader(f)
+    missing = {"title", "description"}.difference(reader.fieldnames or [])
+    if missing:
+        raise CatalogError(f"{path} is missing the columns: {', '.join(sorted(missing))}")
+
+    for row in reader:
+        if not row["title"]:
+            raise CatalogError(f"{path}:{reader.line_num}: Challenge has no title")
+        try:
+            weight = float(row.get("weight") or 1)
+        except ValueError:
+            raise CatalogError(f"{path}:{reader.line_num}: Invalid weight {row['weight']!r}") from None
+        if weight < 0:
+            raise CatalogError(f"{path}:{reader.line_num}: Weight cannot be negative")
+
+        challenges.append(Challenge(
+            row["title"], row["description"] or "",
+            category=row.get("category") or "",
+            difficulty=row.get("difficulty") or "",
+            weight=weight))
+    return challenges
+
+
+# Compiled catalogs are cached next to the CSV. The file is a fixed header,
+# then native-endian arrays of weights, string offsets and category/difficulty
+# ids, a JSON list of the category and difficulty names and finally the UTF-8
+# titles and descriptions. It is memory-mapped and challenges are only built
+# when they are accessed.
+_MAGIC = b"SNKCAT01"
+_HEADER = struct.Struct("=8sQQ32sQQ")  # magic, size, mtime_ns, sha256, count, names length
+_MTIME_OFFSET = struct.calcsize("=8sQ")
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+class CompiledChallenges(Sequence[Challenge]):
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        if len(view) < _HEADER.size:
+            raise CatalogError(f"{path} is truncated")
+        magic, self.source_size, self.source_mtime_ns, self.source_hash, count, names_len = \
+            _HEADER.unpack_from(view)
+        if magic != _MAGIC:
+            raise CatalogError(f"{path} is not a compiled challenge catalog")
+
+        offset = _align(_HEADER.size)
+        if len(view) < offset + count * 8 + (count * 2 + 1) * 8 + count * 8 + names_len:
+            raise CatalogError(f"{path} is truncated")
+        self._count = count
+        self._weights = view[offset:offset + count * 8].cast("d")
+        offset += count * 8
+        self._offsets = view[offset:offset + (count * 2 + 1) * 8].cast("Q")
+        offset += (count * 2 + 1) * 8
+        self._category_ids = view[offset:offset + count * 4].cast("I")
+        offset += count * 4
+        self._difficulty_ids = view[offset:offset + count * 4].cast("I")
+        offset += count * 4
+        self._categories, self._difficulties = json.loads(
+            bytes(view[offset:offset + names_len]))
+        self._blob = view[offset + names_len:]
+        if len(self._blob) < self._offsets[-1]:
+            raise CatalogError(f"{path} is truncated")
+
+    def __len__(self) -> int:
+        return self._count
+
+    @overload
+    def __getitem__(self, i: int) -> Challenge: ...
+    @overload
+    def __getitem__(self, i: slice) -> list[Challenge]: ...
+
+    def __getitem__(self, i: int | slice) -> Challenge | list[Challenge]:
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._count))]
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError("Challenge index out of range")
+        return Challenge(
+            self._string(i * 2), self._string(i * 2 + 1),
+            category=self._categories[self._category_ids[i]],
+            difficulty=self._difficulties[self._difficulty_ids[i]],
+            weight=self._weights[i])
+
+    def _string(self, n: int) -> str:
+        return str(self._blob[self._offsets[n]:self._offsets[n + 1]], "utf-8")
+
+    def column(self, attr: str) -> Sequence[Any]:
+        match attr:
+            case "weight":
+                return self._weights
+            case "category":
+                return [self._categories[i] for i in self._category_ids]
+            case "difficulty":
+                return [self._difficulties[i] for i in self._difficulty_ids]
+            case "title":
+                return [self._string(i * 2) for i in range(self._count)]
+            case "description":
+                return [self._string(i * 2 + 1) for i in range(self._count)]
+            case _:
+                raise KeyError(attr)
+
+
+def compile_catalog(challenges: Sequence[Challenge], cache_path: str, source: os.stat_result, source_hash: bytes):
+    categories: dict[str, int] = {}
+    difficulties: dict[str, int] = {}
+    weights = array("d")
+    offsets = array("Q", [0])
+    category_ids = array("I")
+    difficulty_ids = array("I")
+    blob = bytearray()
+    for c in challenges:
+        weights.append(c.weight)
+        blob += c.title.encode()
+        offsets.append(len(blob))
+        blob += c.description.encode()
+        offsets.append(len(blob))
+        category_ids.append(categories.setdefault(c.category, len(categories)))
+        difficulty_ids.append(difficulties.setdefault(c.difficulty, len(difficulties)))
+    names = json.dumps([list(categories), list(difficulties)]).encode()
+
+    header = _HEADER.pack(_MAGIC, source.st_size, source.st_mtime_ns,
+                          source_hash, len(challenges), len(names))
+    # A unique name per compilation, so concurrent ones never share a file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cache_path) or ".",
+                                    prefix=os.path.basename(cache_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header.ljust(_align(len(header)), b"\0"))
+            for section in (weights, offsets, category_ids, difficulty_ids):
+                f.write(section.tobytes())
+            f.write(names)
+            f.write(blob)
+        # Replacing rather than rewriting keeps existing mappings of the old file valid
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+
+def _open_cached(path: str, cache_path: str, source: os.stat_result) -> Optional[CompiledChallenges]:
+    try:
+        compiled = CompiledChallenges(cache_path)
+    except (OSError, ValueError, TypeError, struct.error, CatalogError):
+        # A missing, truncated or corrupt cache is simply compiled again
+        return None
+    if compiled.source_size != source.st_size:
+        return None
+    if compiled.source_mtime_ns == source.st_mtime_ns:
+        return compiled
+
+    # The file was touched, but may not have changed
+    with open(path, "rb") as f:
+        if hashlib.file_digest(f, "sha256").digest() != compiled.source_hash:
+            return None
+    with open(cache_path, "r+b") as f:
+        f.seek(_MTIME_OFFSET)
+        f.write(struct.pack("=Q", source.st_mtime_ns))
+    return compiled
+
+
+def open_challenges(path: str = CHALLENGES_PATH) -> Sequence[Challenge]:
+    """Opens the compiled catalog for `path`, compiling it first if it is missing or stale."""
+    cache_path = path + CACHE_SUFFIX
+    source = os.stat(path)
+    compiled = _open_cached(path, cache_path, source)
+    if compiled is not None:
+        return compiled
+
+    with open(path, "rb") as f:
+        data = f.read()
+    challenges = parse_challenges(io.StringIO(data.decode(), newline=''), path)
+    try:
+        compile_catalog(challenges, cache_path, source,
+                        hashlib.sha256(data).digest())
+        return CompiledChallenges(cache_path)
+    except OSError as e:
+        logging.warning(f"Cannot cache compiled challenges at {cache_path}: {e}")
+        return challenges
+
+
+def _build_catalog(path: str, version: int) -> Catalog:
+    mtime = os.stat(path).st_mtime
+    challenges = open_challenges(path)
+    if isinstance(challenges, CompiledChallenges):
+        digest = challenges.source_hash.hex()
+    else:
+        with open(path, "rb") as f:
+            digest = hashlib.file_digest(f, "sha256").hexdigest()
+    return Catalog(version, ChallengePool(challenges), mtime, digest)
+
+
+def _swap(catalog: Catalog):
+    global _catalog, _loaded
+    _catalog = catalog
+    _loaded = True
+    logging.info(f"Loaded {len(catalog)} challenges! (catalog version {catalog.version})")
+
+
+def load_catalog(path: str = CHALLENGES_PATH) -> Catalog:
+    with _load_lock:
+        _swap(_build_catalog(path, _catalog.version + 1))
+        return _catalog
+
+
+async def reload_catalog(path: str = CHALLENGES_PATH) -> Catalog:
+    """Parses and validates the challenges off the event loop, then swaps them in.
+
+    Raises:
+        CatalogError: The file is not a valid challenge list. The current catalog is kept.
+    """
+    previous = _catalog
+
+    def build() -> Catalog:
+        catalog = _build_catalog(path, previous.version + 1)
+        # Running games move to the new catalog on a tick, which then only
+        # has to look up the bag sources built here
+        catalog.pool.prepare_like(previous.pool)
+        return catalog
+
+    catalog = await asyncio.to_thread(build)
+    # Another reload may have finished while this one was parsing
+    if catalog.version <= _catalog.version:
+        catalog = Catalog(_catalog.version + 1, catalog.pool, catalog.mtime, catalog.digest)
+    _swap(catalog)
+    return catalog
+
+
+async def watch_catalog(path: str = CHALLENGES_PATH, interval: float = 2,
+                        on_reload: Optional[Callable[[Catalog], Any]] = None):
+    """Reloads the catalog whenever the file's modification time changes,
+    then calls `on_reload` with the new catalog.
+    """
+    last_mtime: Optional[float] = _catalog.mtime
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError as e:
+            logging.warning(f"Cannot watch {path}: {e}")
+            continue
+        if mtime == last_mtime:
+            continue
+        last_mtime = mtime
+        try:
+            catalog = await reload_catalog(path)
+        except (OSError, CatalogError) as e:
+            logging.error(f"Failed to reload challenges: {e}")
+            continue
+        if on_reload is not None:
+            on_reload(catalog)
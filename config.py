@@ -0,0 +1,54 @@
+from dataclasses import dataclass, field
+import json
+import os
+
+
+CONFIG_PATH = os.environ.get("SNAKE_GUILDS", "guilds.json")
+
+
+class ConfigError(ValueError):
+    pass
+
+
+@dataclass
+class GuildConfig:
+    guild_id: int
+    # Roles to use for teams before any new ones are created
+    team_role_ids: list[int] = field(default_factory=list)
+    max_games: int = 1
+
+
+def load_guild_configs(path: str = CONFIG_PATH) -> dict[int, GuildConfig]:
+    """Loads the per-guild configuration, or nothing if the file does not exist.
+
+    The file maps guild IDs to their settings:
+
+        {"1412516526447268075": {"team_role_ids": [1412516839711576144], "max_games": 4}}
+
+    Raises:
+        ConfigError: The file is not valid
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except json.JSONDecodeError as e:
+        raise ConfigError(f"{path} is not valid JSON: {e}") from e
+
+    if not isinstance(raw, dict):
+        raise ConfigError(f"{path} must map guild IDs to their settings")
+    configs = {}
+    for key, values in raw.items():
+        try:
+            guild_id = int(key)
+            config = GuildConfig(
+                guild_id,
+                [int(i) for i in values.get("team_role_ids", [])],
+                int(values.get("max_games", 1)))
+        except (AttributeError, TypeError, ValueError) as e:
+            raise ConfigError(f"Invalid settings for guild {key} in {path}: {e}") from e
+        if config.max_games < 1:
+            raise ConfigError(f"max_games of guild {key} in {path} must be at least 1")
+        configs[guild_id] = config
+    return configs
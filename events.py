@@ -0,0 +1,104 @@
+import asyncio
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+
+from catalog import Challenge
+from metrics import DROPPED_EVENTS
+
+
+@dataclass(frozen=True)
+class GameEvent:
+    cycle_id: int
+
+    def supersedes(self, older: "GameEvent") -> bool:
+        """Whether this event makes `older` pointless to deliver."""
+        return False
+
+
+@dataclass(frozen=True)
+class CycleStarted(GameEvent):
+    def supersedes(self, older: GameEvent) -> bool:
+        # Broadcasts and freezes of earlier cycles, and the countdown to this one
+        return older.cycle_id < self.cycle_id or (
+            isinstance(older, CycleWarning) and older.cycle_id == self.cycle_id)
+
+
+@dataclass(frozen=True)
+class CycleWarning(GameEvent):
+    """Cycle `cycle_id` starts in `Settings.warning_time` seconds."""
+
+
+@dataclass(frozen=True)
+class ChallengeCompleted(GameEvent):
+    challenge_id: int
+    challenge: Challenge
+    next_challenges: list[Challenge] = field(default_factory=list)
+    player_id: Optional[int] = None
+    team_id: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class GameEnded(GameEvent):
+    def supersedes(self, older: GameEvent) -> bool:
+        return True
+
+
+class EventStream:
+    """One consumer's queue of game events.
+
+    Publishing never blocks: events made stale by a newer one are dropped,
+    and when the queue is still full the oldest event is dropped.
+    """
+
+    def __init__(self, maxsize: int = 16):
+        self._maxsize = maxsize
+        self._events: deque[GameEvent] = deque()
+        self._ready = asyncio.Event()
+        self.closed = False
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def publish(self, event: GameEvent):
+        if self.closed:
+            return
+        kept = deque(e for e in self._events if not event.supersedes(e))
+        if len(kept) < len(self._events):
+            DROPPED_EVENTS.inc(len(self._events) - len(kept), reason="stale")
+        if len(kept) >= self._maxsize:
+            kept.popleft()
+            DROPPED_EVENTS.inc(reason="overflow")
+        kept.append(event)
+        self._events = kept
+        # Nothing can follow the end of the game
+        self.closed = isinstance(event, GameEnded)
+        self._ready.set()
+
+    async def get(self) -> GameEvent:
+        while not self._events:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._events.popleft()
+
+    def __aiter__(self) -> "EventStream":
+        return self
+
+    async def __anext__(self) -> GameEvent:
+        if self.closed and not self._events:
+            raise StopAsyncIteration
+        return await self.get()
+
+
+class EventBus:
+    def __init__(self):
+        self._streams: list[EventStream] = []
+
+    def subscribe(self, maxsize: int = 16) -> EventStream:
+        stream = EventStream(maxsize)
+        self._streams.append(stream)
+        return stream
+
+    def publish(self, event: GameEvent):
+        for stream in self._streams:
+            stream.publish(event)
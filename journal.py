@@ -0,0 +1,202 @@
+import contextlib
+from dataclasses import dataclass, field
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, ContextManager, Optional
+
+from batch_writer import BatchWriter
+
+
+JOURNAL_PATH = os.environ.get("SNAKE_JOURNAL", "snake_journal.jsonl")
+
+
+class Journal(BatchWriter):
+    """An append-only event log written by a background thread.
+
+    `record` never blocks: events are queued and the writer thread appends them
+    in batches, with a single fsync per batch.
+    """
+
+    thread_name = "journal-writer"
+
+    def __init__(self, path: str = JOURNAL_PATH, batch_interval: float = 0.05):
+        super().__init__(path, batch_interval)
+
+    def record(self, game_id: int, event: str, **data: Any):
+        self._put({"game": game_id, "event": event, "t": time.time(), **data})
+
+    def for_game(self, game_id: int) -> "GameJournal":
+        return GameJournal(self, game_id)
+
+    def read(self) -> list[dict[str, Any]]:
+        events = []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # A crash can leave the last line half written
+                        logging.warning(f"Skipping corrupt journal entry in {self.path}")
+        except FileNotFoundError:
+            pass
+        return events
+
+    def compact(self, events: list[dict[str, Any]]):
+        """Rewrites the journal with only `events`. Must be called before `start`."""
+        assert self._thread is None
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for e in events:
+                f.write(json.dumps(e) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _open_writer(self) -> ContextManager[Any]:
+        return open(self.path, "a", encoding="utf-8")
+
+    def _write_batch(self, f: Any, batch: list[dict[str, Any]]):
+        f.writelines(json.dumps(e) + "\n" for e in batch)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class SqliteJournal(Journal):
+    """A journal kept in an SQLite database, so that several bot processes can share it."""
+
+    def __init__(self, path: str = JOURNAL_PATH, batch_interval: float = 0.05):
+        super().__init__(path, batch_interval)
+        self._read_up_to = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS events ("
+                   "id INTEGER PRIMARY KEY AUTOINCREMENT, game INTEGER NOT NULL, data TEXT NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS events_game ON events (game)")
+        return db
+
+    def read(self) -> list[dict[str, Any]]:
+        with contextlib.closing(self._connect()) as db:
+            rows = db.execute("SELECT id, data FROM events ORDER BY id").fetchall()
+        self._read_up_to = rows[-1][0] if rows else 0
+        return [json.loads(data) for _, data in rows]
+
+    def compact(self, events: list[dict[str, Any]]):
+        """Deletes the games that were read by `read` and have no events in `events`.
+
+        Events written since the last `read`, possibly by another process, are kept.
+        """
+        keep = {e["game"] for e in events}
+        with contextlib.closing(self._connect()) as db, db:
+            db.execute("CREATE TEMP TABLE keep (game INTEGER PRIMARY KEY)")
+            db.executemany("INSERT INTO keep VALUES (?)", ((g,) for g in keep))
+            db.execute("DELETE FROM events WHERE id <= ? AND game NOT IN (SELECT game FROM keep)",
+                       (self._read_up_to,))
+
+    def _open_writer(self) -> ContextManager[Any]:
+        return contextlib.closing(self._connect())
+
+    def _write_batch(self, db: Any, batch: list[dict[str, Any]]):
+        with db:
+            db.executemany("INSERT INTO events (game, data) VALUES (?, ?)",
+                           ((e["game"], json.dumps(e)) for e in batch))
+
+
+def open_journal(path: str = JOURNAL_PATH) -> Journal:
+    """Opens an SQLite journal for .db paths and a JSON lines journal otherwise."""
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        return SqliteJournal(path)
+    return Journal(path)
+
+
+class GameJournal:
+    def __init__(self, journal: Journal, game_id: int):
+        self._journal = journal
+        self.game_id = game_id
+
+    def record(self, event: str, **data: Any):
+        self._journal.record(self.game_id, event, **data)
+
+
+@dataclass
+class GameRecord:
+    """The state of one game, rebuilt by replaying its journal entries."""
+    game_id: int
+    guild_id: int
+    channel_id: int
+    thread_id: int
+    team_role_ids: list[int]
+    settings: dict[str, Any] = field(default_factory=dict)
+    players: dict[int, int] = field(default_factory=dict)
+    team_thread_ids: dict[int, int] = field(default_factory=dict)
+    started: bool = False
+    paused: bool = False
+    cycle_id: int = 0
+    set_complete: bool = False
+    challenge_queue: list[list[dict[str, Any]]] = field(default_factory=list)
+    # Seeded games can redraw their schedule if the catalog is unchanged
+    seed: Optional[int] = None
+    catalog_digest: str = ""
+    # Messages of the current cycle whose buttons have not been disabled yet
+    challenge_messages: list[dict[str, Any]] = field(default_factory=list)
+    # The game clock as of the last clock event, see `elapsed`
+    clock_elapsed: float = 0
+    clock_at: float = 0
+    events: list[dict[str, Any]] = field(default_factory=list)
+
+    def elapsed(self, now: Optional[float] = None) -> float:
+        if self.paused:
+            return self.clock_elapsed
+        return self.clock_elapsed + max(0.0, (now or time.time()) - self.clock_at)
+
+
+def replay(events: list[dict[str, Any]]) -> dict[int, GameRecord]:
+    """Rebuilds every game that had not ended from a list of journal entries."""
+    games: dict[int, GameRecord] = {}
+    for e in events:
+        game_id = e["game"]
+        if e["event"] == "game_created":
+            games[game_id] = GameRecord(
+                game_id, e["guild_id"], e["channel_id"], e["thread_id"], e["team_role_ids"])
+        record = games.get(game_id)
+        if record is None:
+            continue
+        record.events.append(e)
+
+        match e["event"]:
+            case "teams_changed":
+                record.team_role_ids = e["team_role_ids"]
+            case "setting_changed":
+                record.settings[e["name"]] = e["value"]
+            case "player_joined":
+                record.players[e["user_id"]] = e["team"]
+            case "team_thread_created":
+                record.team_thread_ids[e["team"]] = e["thread_id"]
+            case "game_started":
+                record.started = True
+                record.settings.update(e["settings"])
+                record.challenge_queue = e["challenges"]
+                record.seed, record.catalog_digest = e.get("seed"), e.get("catalog", "")
+                record.clock_elapsed, record.clock_at = 0, e["t"]
+            case "cycle_shifted":
+                record.cycle_id = e["cycle_id"]
+                record.set_complete = False
+                record.challenge_queue = [record.challenge_queue[-1], e["challenges"]]
+                record.challenge_messages = []
+            case "challenge_message_sent":
+                if e["cycle_id"] == record.cycle_id:
+                    record.challenge_messages.append(e)
+            case "challenge_completed":
+                record.set_complete = True
+                record.challenge_messages = []
+            case "game_paused" | "game_resumed":
+                record.paused = e["event"] == "game_paused"
+                record.clock_elapsed, record.clock_at = e["elapsed"], e["t"]
+            case "game_ended":
+                del games[game_id]
+    return games
@@ -0,0 +1,91 @@
+"""Runs the bot as several processes, each connected to its own share of the shards.
+
+Discord sends every event of a guild to the same shard, so each process
+serves a fixed set of guilds. The processes share one SQLite journal.
+
+    python launcher.py --shards 16 --workers 4
+"""
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from typing import Optional
+
+
+BOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "snake_bot.py")
+DEFAULT_JOURNAL = "snake_journal.db"
+RESTART_DELAY = 5
+
+
+def shard_groups(shard_count: int, workers: int) -> list[list[int]]:
+    return [list(range(i, shard_count, workers)) for i in range(min(workers, shard_count))]
+
+
+class Worker:
+    def __init__(self, index: int, shard_ids: list[int], shard_count: int, journal: str):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.env = {
+            **os.environ,
+            "SHARD_COUNT": str(shard_count),
+            "SHARD_IDS": ",".join(map(str, shard_ids)),
+            "SNAKE_JOURNAL": journal,
+        }
+        if os.environ.get("METRICS_PORT"):
+            self.env["METRICS_PORT"] = str(int(os.environ["METRICS_PORT"]) + index)
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        logging.info(f"Starting worker {self.index} with shards {self.shard_ids}")
+        self.process = subprocess.Popen([sys.executable, BOT_PATH], env=self.env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    journal = os.environ.get("SNAKE_JOURNAL", DEFAULT_JOURNAL)
+    if not journal.endswith((".db", ".sqlite", ".sqlite3")):
+        # A JSON lines journal cannot be shared between processes
+        logging.warning(f"SNAKE_JOURNAL={journal} is not an SQLite database, using {DEFAULT_JOURNAL}")
+        journal = DEFAULT_JOURNAL
+
+    workers = [Worker(i, shards, args.shards, journal)
+               for i, shards in enumerate(shard_groups(args.shards, args.workers))]
+    stopping = False
+
+    def stop(*_):
+        nonlocal stopping
+        stopping = True
+        for w in workers:
+            if w.process is not None and w.process.poll() is None:
+                w.process.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for w in workers:
+        w.start()
+    while not stopping:
+        time.sleep(1)
+        for w in workers:
+            assert w.process is not None
+            code = w.process.poll()
+            if code is not None and not stopping:
+                logging.error(f"Worker {w.index} exited with code {code}, restarting in {RESTART_DELAY}s")
+                time.sleep(RESTART_DELAY)
+                if not stopping:
+                    w.start()
+    for w in workers:
+        if w.process is not None:
+            w.process.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import asyncio
+from bisect import bisect_left
+from collections.abc import AsyncIterator, Iterator, Sequence
+import contextlib
+import logging
+import math
+import time
+from typing import Optional
+
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: dict[str, object]) -> tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _format_labels(self, key: tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.type}"
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: object):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def remove(self, **labels: object):
+        self._values.pop(self._key(labels), None)
+
+    def render(self) -> Iterator[str]:
+        yield from super().render()
+        for key, value in self._values.items():
+            yield f"{self.name}{self._format_labels(key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: a count for each bucket plus +Inf, then the sum
+        self._values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, **labels: object):
+        key = self._key(labels)
+        counts = self._values.get(key)
+        if counts is None:
+            counts = self._values[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels: object) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> Iterator[str]:
+        yield from super().render()
+        for key, counts in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                le = 'le="' + ("+Inf" if bound == math.inf else _format_value(bound)) + '"'
+                yield f"{self.name}_bucket{self._format_labels(key, le)} {cumulative:g}"
+            yield f"{self.name}_sum{self._format_labels(key)} {_format_value(counts[-1])}"
+            yield f"{self.name}_count{self._format_labels(key)} {cumulative:g}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        assert metric.name not in self._metrics
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self.register(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self.register(metric)
+        return metric
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+REGISTRY = Registry()
+
+DISCORD_LATENCY = REGISTRY.histogram(
+    "snake_discord_api_seconds", "Latency of Discord API calls", ["operation"])
+LOCK_WAIT = REGISTRY.histogram(
+    "snake_lock_wait_seconds", "Time spent waiting to acquire a lock", ["lock"],
+    buckets=(0.0001, 0.0005, *DEFAULT_BUCKETS))
+TICK_LATENESS = REGISTRY.histogram(
+    "snake_cycle_tick_lateness_seconds", "How late cycle ticks fire after their deadline",
+    buckets=(0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1, 2.5, 5))
+LOOP_LAG = REGISTRY.histogram(
+    "snake_event_loop_lag_seconds", "How late the event loop heartbeat wakes up")
+LOOP_STALLS = REGISTRY.counter(
+    "snake_event_loop_stalls_total", "Times the event loop was blocked past the watchdog threshold")
+TEARDOWN_OPERATIONS = REGISTRY.counter(
+    "snake_teardown_operations_total", "Clean-up API calls of ended games by result", ["result"])
+DROPPED_EVENTS = REGISTRY.counter(
+    "snake_dropped_game_events_total", "Game events dropped before delivery", ["reason"])
+COMPLETIONS = REGISTRY.counter(
+    "snake_challenge_completions_total", "Challenges completed", ["game"])
+REJECTED_CLICKS = REGISTRY.counter(
+    "snake_rejected_clicks_total", "Complete Challenge clicks that were rejected", ["game"])
+EXPIRED_CYCLE_ERRORS = REGISTRY.counter(
+    "snake_expired_cycle_errors_total", "Clicks on challenges from an expired cycle", ["game"])
+
+
+@contextlib.asynccontextmanager
+async def timed_lock(lock: asyncio.Lock, name: str) -> AsyncIterator[None]:
+    start = time.perf_counter()
+    async with lock:
+        LOCK_WAIT.observe(time.perf_counter() - start, lock=name)
+        yield
+
+
+def remove_game(game_id: int):
+    for counter in (COMPLETIONS, REJECTED_CLICKS, EXPIRED_CYCLE_ERRORS):
+        counter.remove(game=game_id)
+
+
+async def _handle_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, registry: Registry):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", registry.render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(port: int, host: str = "127.0.0.1", registry: Optional[Registry] = None) -> asyncio.Server:
+    """Serves the metrics at http://host:port/metrics."""
+    registry = registry or REGISTRY
+    server = await asyncio.start_server(
+        lambda r, w: _handle_request(r, w, registry), host, port)
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
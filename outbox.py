@@ -0,0 +1,192 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from enum import IntEnum
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Optional
+
+import discord
+
+from metrics import DISCORD_LATENCY
+
+
+class Priority(IntEnum):
+    CRITICAL = 0  # Challenges, freezes and anything else the game depends on
+    NORMAL = 1
+    COSMETIC = 2  # Countdown edits and clean-up
+
+
+class TokenBucket:
+    def __init__(self, rate: int, per: float):
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._last = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens +
+                           (now - self._last) * self.rate / self.per)
+        self._last = now
+
+    def refill_time(self) -> float:
+        """Seconds until the bucket is full again."""
+        self._refill()
+        return (self.rate - self._tokens) * self.per / self.rate
+
+    def delay(self) -> float:
+        self._refill()
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) * self.per / self.rate
+
+    async def acquire(self):
+        while (delay := self.delay()) > 0:
+            await asyncio.sleep(delay)
+        self._tokens -= 1
+
+
+class _Op:
+    __slots__ = ("priority", "seq", "func", "kwargs",
+                 "future", "edit_key", "started")
+
+    def __init__(self, priority: Priority, seq: int, func: Callable[..., Awaitable[Any]], kwargs: dict[str, Any]):
+        self.priority = priority
+        self.seq = seq
+        self.func = func
+        self.kwargs = kwargs
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.edit_key: Optional[int] = None
+        self.started = False
+
+    def __lt__(self, other: "_Op") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class _ChannelQueue:
+    def __init__(self, bucket: TokenBucket):
+        self.bucket = bucket
+        self.heap: list[_Op] = []
+        self.worker: Optional[asyncio.Task] = None
+
+
+class Outbox:
+    """Queues outgoing messages per channel behind Discord-like rate limits.
+
+    Each channel has its own token bucket and all channels share a global one.
+    Queued operations go out in priority order, and an edit that has not been
+    sent yet is replaced by any later edit to the same message.
+    """
+
+    def __init__(self, channel_rate: int = 5, channel_per: float = 5,
+                 global_rate: int = 50, global_per: float = 1):
+        self._channel_rate = channel_rate
+        self._channel_per = channel_per
+        self._global_bucket = TokenBucket(global_rate, global_per)
+        self._channels: dict[int, _ChannelQueue] = {}
+        # Buckets outlive their queue until they have refilled, so that sends
+        # awaited one after the other are still throttled
+        self._buckets: dict[int, TokenBucket] = {}
+        self._pending_edits: dict[int, _Op] = {}
+        self._seq = itertools.count()
+
+    async def send(self, channel: discord.Thread | discord.TextChannel, content: Optional[str] = None, *,
+                   priority: Priority = Priority.CRITICAL, **kwargs) -> discord.Message:
+        return await self._submit(channel.id, priority, channel.send, dict(content=content, **kwargs)).future
+
+    def edit(self, message: discord.Message, *, priority: Priority = Priority.COSMETIC, **kwargs) -> asyncio.Future:
+        """Queues an edit. The returned future may be awaited or dropped."""
+        op = self._pending_edits.get(message.id)
+        if op is not None and not op.started:
+            op.kwargs.update(kwargs)
+            if priority < op.priority:
+                self._reprioritize(message.channel.id, op, priority)
+            return op.future
+
+        op = self._submit(message.channel.id, priority, message.edit, kwargs)
+        op.edit_key = message.id
+        self._pending_edits[message.id] = op
+        return op.future
+
+    async def delete(self, message: discord.Message, *, priority: Priority = Priority.COSMETIC):
+        # A pending edit to a message that is about to be deleted is pointless
+        op = self._pending_edits.pop(message.id, None)
+        if op is not None and not op.started:
+            op.started = True
+            op.future.set_result(message)
+        await self._submit(message.channel.id, priority, message.delete, {}).future
+
+    def _submit(self, channel_id: int, priority: Priority, func: Callable[..., Awaitable[Any]],
+                kwargs: dict[str, Any]) -> _Op:
+        queue = self._channels.get(channel_id)
+        if queue is None:
+            bucket = self._buckets.get(channel_id)
+            if bucket is None:
+                bucket = self._buckets[channel_id] = TokenBucket(self._channel_rate, self._channel_per)
+            queue = self._channels[channel_id] = _ChannelQueue(bucket)
+
+        op = _Op(priority, next(self._seq), func, kwargs)
+        heapq.heappush(queue.heap, op)
+        if queue.worker is None or queue.worker.done():
+            queue.worker = asyncio.create_task(self._drain(channel_id, queue))
+        return op
+
+    def _reprioritize(self, channel_id: int, op: _Op, priority: Priority):
+        op.priority = priority
+        heapq.heapify(self._channels[channel_id].heap)
+
+    async def _drain(self, channel_id: int, queue: _ChannelQueue):
+        while queue.heap:
+            await queue.bucket.acquire()
+            await self._global_bucket.acquire()
+
+            # Pick the op only once tokens are available, so urgent ops queued
+            # while waiting still go first
+            op = None
+            while queue.heap:
+                op = heapq.heappop(queue.heap)
+                # Skip superseded ops and ones whose caller was cancelled
+                if not op.started and not op.future.done():
+                    break
+                op = None
+            if op is None:
+                break
+
+            op.started = True
+            if op.edit_key is not None and self._pending_edits.get(op.edit_key) is op:
+                del self._pending_edits[op.edit_key]
+            try:
+                with DISCORD_LATENCY.time(operation=op.func.__name__):
+                    result = await op.func(**op.kwargs)
+            except Exception as e:
+                logging.warning(f"Outbox operation on channel {channel_id} failed: {e!r}")
+                if not op.future.done():
+                    op.future.set_exception(e)
+                    op.future.exception()  # Already logged, so fire-and-forget callers are not warned again
+            else:
+                if not op.future.done():
+                    op.future.set_result(result)
+
+        if self._channels.get(channel_id) is queue and not queue.heap:
+            del self._channels[channel_id]
+            self._forget_bucket(channel_id, queue.bucket)
+
+    def _forget_bucket(self, channel_id: int, bucket: TokenBucket):
+        if channel_id in self._channels or self._buckets.get(channel_id) is not bucket:
+            return
+        if (refill := bucket.refill_time()) > 0:
+            asyncio.get_running_loop().call_later(refill, self._forget_bucket, channel_id, bucket)
+        else:
+            del self._buckets[channel_id]
+
+
+_outbox: Optional[Outbox] = None
+
+
+def get_outbox() -> Outbox:
+    global _outbox
+    if _outbox is None:
+        _outbox = Outbox()
+    return _outbox
@@ -0,0 +1,69 @@
+import asyncio
+from collections import defaultdict
+from collections.abc import Iterable, Sequence
+
+import discord
+
+
+ROLE_PREFIX = "Snake Team "
+
+
+class RolePool:
+    """Hands out team roles to games, creating new ones only when every pooled role is in use.
+
+    A guild's pool starts with the configured roles and any role left over
+    from an earlier run, recognised by its name. Roles go back to the pool
+    when the game that used them releases them.
+    """
+
+    def __init__(self, seed_role_ids: Iterable[int] = ()):
+        self._seed_role_ids = set(seed_role_ids)
+        self._free: dict[int, list[discord.Role]] = {}
+        self._in_use: defaultdict[int, set[int]] = defaultdict(set)
+        self._known: defaultdict[int, int] = defaultdict(int)
+        self._locks: defaultdict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+    def _seed(self, guild: discord.Guild) -> list[discord.Role]:
+        free = self._free.get(guild.id)
+        if free is None:
+            in_use = self._in_use[guild.id]
+            free = self._free[guild.id] = [
+                r for r in guild.roles
+                if (r.id in self._seed_role_ids or r.name.startswith(ROLE_PREFIX)) and r.id not in in_use]
+            self._known[guild.id] = len(free) + len(in_use)
+        return free
+
+    def claim(self, guild: discord.Guild, roles: Sequence[discord.Role]):
+        """Marks roles as in use, e.g. by a game restored after a restart."""
+        ids = {r.id for r in roles}
+        self._in_use[guild.id].update(ids)
+        if guild.id in self._free:
+            self._free[guild.id] = [r for r in self._free[guild.id] if r.id not in ids]
+
+    async def acquire(self, guild: discord.Guild, count: int) -> list[discord.Role]:
+        async with self._locks[guild.id]:
+            free = self._seed(guild)
+            roles = free[:count]
+            del free[:count]
+
+            first = self._known[guild.id] + 1
+            missing = count - len(roles)
+            self._known[guild.id] += missing
+            try:
+                created = await asyncio.gather(*(
+                    guild.create_role(name=f"{ROLE_PREFIX}{first + i}", mentionable=True)
+                    for i in range(missing)))
+            except discord.HTTPException:
+                free.extend(roles)
+                raise
+            roles.extend(created)
+            self._in_use[guild.id].update(r.id for r in roles)
+            return roles
+
+    def release(self, guild: discord.Guild, roles: Sequence[discord.Role]):
+        in_use = self._in_use[guild.id]
+        free = self._seed(guild)
+        for role in roles:
+            if role.id in in_use:
+                in_use.discard(role.id)
+                free.append(role)
@@ -0,0 +1,291 @@
+from array import array
+from collections.abc import Collection, Sequence
+import random
+from typing import Any, Optional
+
+
+class ChallengePool:
+    """An immutable list of challenges indexed by their categorical attributes.
+
+    Indexes are built the first time an attribute is filtered on. Sequences
+    that can read an attribute without materializing every challenge (like a
+    compiled catalog) may provide a `column(attr)` method.
+    """
+
+    INDEXED_ATTRIBUTES = ("category", "difficulty")
+
+    def __init__(self, challenges: Sequence[Any]):
+        self.challenges = challenges
+        self._indexes: dict[str, dict[str, list[int]]] = {}
+        self._bag_sources: dict[tuple[bool, tuple[tuple[str, str], ...]], BagSource] = {}
+
+    def __len__(self) -> int:
+        return len(self.challenges)
+
+    def __getitem__(self, i: int) -> Any:
+        return self.challenges[i]
+
+    def column(self, attr: str) -> Sequence[Any]:
+        column = getattr(self.challenges, "column", None)
+        if column is not None:
+            return column(attr)
+        return [getattr(c, attr) for c in self.challenges]
+
+    def _index(self, attr: str) -> dict[str, list[int]]:
+        index = self._indexes.get(attr)
+        if index is None:
+            assert attr in self.INDEXED_ATTRIBUTES
+            index = {}
+            for i, value in enumerate(self.column(attr)):
+                index.setdefault(value, []).append(i)
+            self._indexes[attr] = index
+        return index
+
+    def bag_source(self, weighted: bool = False, **filters: Optional[str]) -> "BagSource":
+        """The shared, immutable part of every bag over these filters, built the first time it is needed."""
+        key = (weighted, tuple(sorted((k, v) for k, v in filters.items() if v is not None)))
+        source = self._bag_sources.get(key)
+        if source is None:
+            indices = self.indices(**filters)
+            weights = None
+            if weighted:
+                column = self.column("weight")
+                weights = [column[i] for i in indices]
+                if sum(weights) <= 0:
+                    # Nothing can be drawn, which callers report like an empty pool
+                    indices, weights = [], None
+            source = self._bag_sources[key] = BagSource(indices, weights)
+        return source
+
+    def prepare_like(self, other: "ChallengePool"):
+        """Builds the bag sources that `other` has built, e.g. for the games still drawing from it."""
+        for weighted, filters in list(other._bag_sources):
+            self.bag_source(weighted, **dict(filters))
+
+    def values(self, attr: str) -> list[str]:
+        return sorted(self._index(attr))
+
+    def indices(self, **filters: Optional[str]) -> Sequence[int]:
+        """Returns the indices of the challenges matching every non-None filter."""
+        selected: Optional[set[int]] = None
+        smallest: Sequence[int] = range(len(self.challenges))
+        for attr, value in filters.items():
+            if value is None:
+                continue
+            matches = self._index(attr).get(value, [])
+            if selected is None:
+                selected = set(matches)
+                smallest = matches
+            else:
+                selected.intersection_update(matches)
+        if selected is None:
+            return smallest
+        if len(selected) == len(smallest):
+            return smallest
+        return sorted(selected)
+
+
+class ShuffleBag:
+    """Draws challenge indices without repeats until the bag is exhausted.
+
+    Uniform bags run an incremental Fisher-Yates shuffle, so each draw is O(1)
+    and every index comes out exactly once per pass. Weighted bags draw from an
+    alias table and reject indices already drawn this pass; a pass ends once
+    half of the total weight has been drawn, which bounds the expected number
+    of rejections per draw by two.
+    """
+
+    MAX_REJECTIONS = 64
+
+    def __init__(self, source: "BagSource", rng: Optional[random.Random] = None):
+        self._rng = rng or random.Random()
+        # The shuffle is stored sparsely as the positions that differ from
+        # `indices`, so creating a bag over a huge pool is O(1)
+        self._source = source
+        self._bag = source.indices
+        self._size = len(source.indices)
+        self._moved: dict[int, int] = {}  # position -> index
+        self._pos: dict[int, int] = {}  # index -> position
+        self._remaining = self._size
+
+        self._alias = source.alias
+        self._drawable = source.drawable
+        self._drawn: set[int] = set()
+        self._drawn_weight = 0.0
+
+    def __len__(self) -> int:
+        return self._drawable
+
+    def draw_many(self, k: int, exclude: Collection[int] = ()) -> list[int]:
+        """Draws k distinct indices, avoiding `exclude` when the bag is big enough."""
+        if k > self._drawable:
+            raise ValueError("Sample larger than the bag")
+        blocked = {i for i in exclude if self._position(i) is not None}
+        if self._drawable < k + len(blocked) * 2:
+            blocked.clear()
+
+        if self._alias is not None:
+            return self._draw_weighted_many(k, blocked)
+
+        drawn: list[int] = []
+        held: list[int] = []  # Consumed only to keep them out of this draw
+        while len(drawn) < k:
+            if self._remaining == 0:
+                # Start a new pass without the challenges that were just shown
+                self._remaining = self._size
+                held = list(blocked.union(drawn))
+                for i in held:
+                    self._consume(i)
+            i = self._draw()
+            if i in blocked:
+                held.append(i)
+                continue
+            drawn.append(i)
+        for i in held:
+            self._unconsume(i)
+        return drawn
+
+    def _at(self, p: int) -> int:
+        i = self._moved.get(p)
+        return self._bag[p] if i is None else i
+
+    def _position(self, i: int) -> Optional[int]:
+        p = self._pos.get(i)
+        if p is not None:
+            return p
+        return self._source.position(i)
+
+    def _swap(self, p: int, q: int):
+        i, j = self._at(p), self._at(q)
+        self._moved[p], self._moved[q] = j, i
+        self._pos[j], self._pos[i] = p, q
+
+    def _draw(self) -> int:
+        j = self._rng.randrange(self._remaining)
+        self._remaining -= 1
+        self._swap(j, self._remaining)
+        return self._at(self._remaining)
+
+    def _consume(self, i: int):
+        p = self._position(i)
+        assert p is not None
+        self._remaining -= 1
+        self._swap(p, self._remaining)
+
+    def _unconsume(self, i: int):
+        p = self._position(i)
+        assert p is not None
+        self._swap(p, self._remaining)
+        self._remaining += 1
+
+    def _draw_weighted_many(self, k: int, blocked: set[int]) -> list[int]:
+        assert self._alias is not None and self._source.weights is not None
+        if self._drawn_weight * 2 >= self._source.total_weight or len(self._drawn) + k > self._drawable:
+            self._drawn.clear()
+            self._drawn_weight = 0.0
+
+        batch: list[int] = []
+        for _ in range(k):
+            rejections = 0
+            while True:
+                pos = self._alias.draw(self._rng)
+                i = self._bag[pos]
+                if i in batch:
+                    continue
+                if (i in self._drawn or i in blocked) and rejections < self.MAX_REJECTIONS:
+                    rejections += 1
+                    continue
+                break
+            self._drawn.add(i)
+            self._drawn_weight += self._source.weights[pos]
+            batch.append(i)
+        return batch
+
+
+class BagSource:
+    """What every bag over the same pool, filters and weighting shares.
+
+    Building it is O(n), so it is cached by `ChallengePool.bag_source` and a
+    bag only adds its own RNG and the state of its current pass.
+    """
+
+    def __init__(self, indices: Sequence[int], weights: Optional[Sequence[float]] = None):
+        self.indices = indices
+        self.weights = weights
+        self.alias: Optional[_AliasTable] = None
+        self.total_weight = 0.0
+        self.drawable = len(indices)
+        if weights is not None:
+            self.alias = _AliasTable(weights)
+            self.total_weight = sum(weights)
+            self.drawable = sum(1 for w in weights if w > 0)
+        self._positions: Optional[dict[int, int]] = None
+        if not isinstance(indices, range):
+            self._positions = {i: p for p, i in enumerate(indices)}
+
+    def position(self, i: int) -> Optional[int]:
+        """The position of index `i` in `indices`, or None if it is not in the bag."""
+        if self._positions is None:
+            return i - self.indices.start if i in self.indices else None
+        return self._positions.get(i)
+
+
+class _AliasTable:
+    """Vose's alias method: O(n) to build, O(1) per weighted draw."""
+
+    def __init__(self, weights: Sequence[float]):
+        n = len(weights)
+        total = sum(weights)
+        if n == 0 or total <= 0:
+            raise ValueError("Weights must have a positive sum")
+
+        scaled = [w * n / total for w in weights]
+        self._prob = [1.0] * n
+        self._alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] -= 1 - scaled[s]
+            (small if scaled[l] < 1 else large).append(l)
+
+    def draw(self, rng: random.Random) -> int:
+        i = rng.randrange(len(self._prob))
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+
+class Schedule:
+    """The challenges of every cycle of a game, drawn up front from one bag.
+
+    Stored as a flat array of pool indices, `per_cycle` of them per cycle.
+    Looking up a cycle is O(1); a game that outlasts the schedule draws more
+    cycles from the same bag, so the result depends only on the bag's seed.
+    """
+
+    def __init__(self, bag: ShuffleBag, per_cycle: int, cycles: int):
+        self._bag = bag
+        self.per_cycle = per_cycle
+        self.indices = array("I")
+        self._extend(cycles)
+
+    def __len__(self) -> int:
+        return len(self.indices) // self.per_cycle
+
+    def cycle(self, n: int) -> list[int]:
+        if n >= len(self):
+            self._extend(max(n + 1 - len(self), len(self)))
+        start = n * self.per_cycle
+        return self.indices[start:start + self.per_cycle].tolist()
+
+    def _extend(self, cycles: int):
+        last = self.indices[-self.per_cycle:].tolist() if self.indices else []
+        for _ in range(cycles):
+            last = self._bag.draw_many(self.per_cycle, exclude=last)
+            self.indices.extend(last)
+
+
+def build_bag(pool: ChallengePool, weighted: bool = False, rng: Optional[random.Random] = None,
+              **filters: Optional[str]) -> ShuffleBag:
+    return ShuffleBag(pool.bag_source(weighted, **filters), rng)
@@ -0,0 +1,198 @@
+import asyncio
+from collections.abc import Callable
+import heapq
+import logging
+from typing import Any, Optional
+
+
+class TimerHandle:
+    __slots__ = ("deadline", "_callback", "_args", "_cancelled")
+
+    def __init__(self, deadline: float, callback: Callable[..., Any], args: tuple):
+        self.deadline = deadline
+        self._callback = callback
+        self._args = args
+        self._cancelled = False
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    def cancel(self):
+        self._cancelled = True
+
+    def _run(self):
+        if self._cancelled:
+            return
+        try:
+            self._callback(*self._args)
+        except Exception:
+            logging.exception("Unhandled exception in scheduled callback")
+
+
+class Scheduler:
+    """A hashed timer wheel shared by every game.
+
+    Deadlines are rounded up to `resolution` and grouped into slots. Only the
+    earliest slot is armed on the event loop, so every timer due in that slot
+    is fired in one pass no matter how many games are running.
+    """
+
+    def __init__(self, resolution: float = 0.05):
+        self.resolution = resolution
+        self._slots: dict[int, list[TimerHandle]] = {}
+        self._slot_heap: list[int] = []
+        self._armed_slot: Optional[int] = None
+        self._armed_timer: Optional[asyncio.TimerHandle] = None
+        self.wakeups = 0
+
+    @staticmethod
+    def now() -> float:
+        return asyncio.get_running_loop().time()
+
+    def call_at(self, deadline: float, callback: Callable[..., Any], *args) -> TimerHandle:
+        handle = TimerHandle(deadline, callback, args)
+        slot = -int(-deadline // self.resolution)  # ceil
+        bucket = self._slots.get(slot)
+        if bucket is None:
+            self._slots[slot] = bucket = []
+            heapq.heappush(self._slot_heap, slot)
+            self._arm()
+        bucket.append(handle)
+        return handle
+
+    def call_later(self, delay: float, callback: Callable[..., Any], *args) -> TimerHandle:
+        return self.call_at(self.now() + delay, callback, *args)
+
+    async def sleep_until(self, deadline: float):
+        future = asyncio.get_running_loop().create_future()
+        handle = self.call_at(deadline, _resolve, future)
+        try:
+            await future
+        finally:
+            handle.cancel()
+
+    async def sleep(self, delay: float):
+        await self.sleep_until(self.now() + delay)
+
+    def _arm(self):
+        if not self._slot_heap:
+            return
+        slot = self._slot_heap[0]
+        if slot == self._armed_slot:
+            return
+        if self._armed_timer is not None:
+            self._armed_timer.cancel()
+        self._armed_slot = slot
+        self._armed_timer = asyncio.get_running_loop().call_at(
+            slot * self.resolution, self._fire)
+
+    def _fire(self):
+        self.wakeups += 1
+        # The loop may run a timer slightly early, so the armed slot is always due
+        now_slot = max(self._armed_slot or 0, self.now() / self.resolution)
+        self._armed_slot = self._armed_timer = None
+
+        due = []
+        while self._slot_heap and self._slot_heap[0] <= now_slot:
+            due.extend(self._slots.pop(heapq.heappop(self._slot_heap)))
+        for handle in due:
+            handle._run()
+        self._arm()
+
+
+def _resolve(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+_scheduler: Optional[Scheduler] = None
+
+
+def get_scheduler() -> Scheduler:
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
+
+
+class _PausableEntry:
+    __slots__ = ("deadline", "callback", "args", "handle", "_timer")
+
+    def __init__(self, timer: "PausableTimer", deadline: float, callback: Callable[..., Any], args: tuple):
+        self._timer = timer
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.handle: Optional[TimerHandle] = None
+
+    def cancel(self):
+        if self.handle is not None:
+            self.handle.cancel()
+        self._timer._entries.discard(self)
+
+    def _fire(self):
+        self._timer._entries.discard(self)
+        self.callback(*self.args)
+
+
+class PausableTimer:
+    """A game clock on top of a Scheduler.
+
+    Deadlines are absolute offsets from the moment the timer started, so they
+    never drift with the time spent in callbacks. Pausing shifts the origin by
+    the paused duration, which keeps every pending deadline's remaining time.
+    """
+
+    def __init__(self, scheduler: Scheduler):
+        self._scheduler = scheduler
+        self._origin: Optional[float] = None
+        self._paused_at: Optional[float] = None
+        self._entries: set[_PausableEntry] = set()
+
+    @property
+    def is_running(self) -> bool:
+        return self._origin is not None and self._paused_at is None
+
+    def start(self, elapsed: float = 0):
+        self._origin = self._scheduler.now() - elapsed
+
+    def elapsed(self) -> float:
+        assert self._origin is not None
+        if self._paused_at is not None:
+            return self._paused_at - self._origin
+        return self._scheduler.now() - self._origin
+
+    def lateness(self, deadline: float) -> float:
+        return self.elapsed() - deadline
+
+    def call_at(self, deadline: float, callback: Callable[..., Any], *args) -> _PausableEntry:
+        entry = _PausableEntry(self, deadline, callback, args)
+        self._entries.add(entry)
+        if self.is_running:
+            self._arm(entry)
+        return entry
+
+    def pause(self):
+        assert self.is_running
+        self._paused_at = self._scheduler.now()
+        for entry in self._entries:
+            if entry.handle is not None:
+                entry.handle.cancel()
+                entry.handle = None
+
+    def resume(self):
+        assert self._origin is not None and self._paused_at is not None
+        self._origin += self._scheduler.now() - self._paused_at
+        self._paused_at = None
+        for entry in self._entries:
+            self._arm(entry)
+
+    def cancel_all(self):
+        for entry in list(self._entries):
+            entry.cancel()
+
+    def _arm(self, entry: _PausableEntry):
+        assert self._origin is not None
+        entry.handle = self._scheduler.call_at(
+            self._origin + entry.deadline, entry._fire)
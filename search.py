@@ -0,0 +1,242 @@
+from array import array
+import asyncio
+from bisect import bisect_left
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
+import functools
+import operator
+from typing import Optional
+
+from catalog import Catalog, Challenge, ensure_catalog, loaded_catalog
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+# Maps every non-zero byte to 1, so that they can be found with bytes.find
+_NONZERO = bytes([0] + [1] * 255)
+
+
+def _bitmap(positions: Iterable[int], size: int) -> int:
+    bits = bytearray((size + 7) // 8)
+    for i in positions:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, "little")
+
+
+def _bit_positions(bitmap: int, size: int) -> Iterator[int]:
+    data = bitmap.to_bytes((size + 7) // 8, "little")
+    flags = data.translate(_NONZERO)
+    k = flags.find(1)
+    while k >= 0:
+        byte = data[k]
+        for bit in range(8):
+            if byte >> bit & 1:
+                yield k * 8 + bit
+        k = flags.find(1, k + 1)
+
+
+class _TrigramIndex:
+    """The positions of the texts containing each trigram.
+
+    Trigrams in more than 1/DENSE of the texts are stored as bitmaps, which
+    are smaller than their position arrays and intersect in one operation.
+    """
+
+    DENSE = 64
+
+    def __init__(self, texts: list[str], postings: dict[str, array | int]):
+        self.texts = texts
+        self.postings = postings
+
+    def _is_dense(self, count: int) -> bool:
+        return count * self.DENSE > len(self.texts)
+
+    @classmethod
+    def build(cls, texts: list[str]) -> "_TrigramIndex":
+        positions: dict[str, list[int]] = defaultdict(list)
+        for i, text in enumerate(texts):
+            for gram in _trigrams(text):
+                positions[gram].append(i)
+        index = cls(texts, {})
+        index.postings = {gram: _bitmap(p, len(texts)) if index._is_dense(len(p)) else array("I", p)
+                          for gram, p in positions.items()}
+        return index
+
+    def update(self, texts: list[str], remap: array, added: list[int]) -> "_TrigramIndex":
+        """Indexes `texts`, given which old positions they kept (see `SearchIndex._diff`)."""
+        stale = {i for i, m in enumerate(remap) if m != i}
+        if len(stale) * 4 > len(remap):
+            return self.build(texts)
+
+        # Only the trigrams that a position gained or lost change, every other
+        # posting is shared with the previous index
+        reindexed = {m for i in stale if (m := remap[i]) >= 0}.union(added)
+        removed: dict[str, list[int]] = defaultdict(list)
+        inserted: dict[str, list[int]] = defaultdict(list)
+        for i in stale | reindexed:
+            old = _trigrams(self.texts[i]) if i in stale else set()
+            new = _trigrams(texts[i]) if i in reindexed else set()
+            for gram in old - new:
+                removed[gram].append(i)
+            for gram in new - old:
+                inserted[gram].append(i)
+
+        index = _TrigramIndex(texts, dict(self.postings))
+        for gram in removed.keys() | inserted.keys():
+            posting = index.postings.get(gram, array("I"))
+            if isinstance(posting, int):
+                for i in removed.get(gram, ()):
+                    posting &= ~(1 << i)
+                for i in inserted.get(gram, ()):
+                    posting |= 1 << i
+                if not index._is_dense(posting.bit_count() * 2):
+                    posting = array("I", _bit_positions(posting, len(texts)))
+            else:
+                posting = array("I", posting)
+                for i in removed.get(gram, ()):
+                    posting.remove(i)
+                posting.extend(inserted.get(gram, ()))
+                if index._is_dense(len(posting)):
+                    posting = _bitmap(posting, len(texts))
+            if posting:
+                index.postings[gram] = posting
+            else:
+                index.postings.pop(gram, None)
+        return index
+
+    def search(self, query: str, limit: int, skip: set[int]) -> list[int]:
+        """Positions of up to `limit` texts containing `query`, which has at least 3 characters."""
+        postings = [self.postings.get(gram) for gram in _trigrams(query)]
+        if any(p is None for p in postings):
+            return []
+        sparse = [p for p in postings if isinstance(p, array)]
+        candidates: Iterable[int]
+        if sparse:
+            # Checking at most 1/DENSE of the texts is cheaper than intersecting
+            candidates = min(sparse, key=len)
+        else:
+            candidates = _bit_positions(functools.reduce(operator.and_, postings), len(self.texts))
+        found: list[int] = []
+        for i in candidates:
+            if i not in skip and query in self.texts[i]:
+                found.append(i)
+                if len(found) == limit:
+                    break
+        return found
+
+
+class SearchIndex:
+    """Finds the challenges of a catalog by title and description.
+
+    Titles are matched by word prefix for queries under 3 characters and by
+    substring through a trigram index otherwise, then descriptions by substring.
+    Built from a previous index, only the challenges that changed are re-indexed.
+    """
+
+    def __init__(self, catalog: Catalog, previous: Optional["SearchIndex"] = None):
+        self.catalog = catalog
+        titles = [normalize(t) for t in catalog.pool.column("title")]
+        descriptions = [normalize(d) for d in catalog.pool.column("description")]
+
+        if previous is None:
+            self._titles = _TrigramIndex.build(titles)
+            self._descriptions = _TrigramIndex.build(descriptions)
+            words = [(word, i) for i, title in enumerate(titles) for word in set(title.split())]
+        else:
+            remap, added = previous._diff(titles, descriptions)
+            self._titles = previous._titles.update(titles, remap, added)
+            self._descriptions = previous._descriptions.update(descriptions, remap, added)
+            words = [(word, m) for word, i in zip(previous._words, previous._word_positions) if (m := remap[i]) >= 0]
+            words += [(word, i) for i in added for word in set(titles[i].split())]
+        words.sort()
+        self._words = [word for word, _ in words]
+        self._word_positions = array("I", (i for _, i in words))
+        self._exact: dict[str, int] = {}
+        for i, title in enumerate(titles):
+            self._exact.setdefault(title, i)
+
+    def __len__(self) -> int:
+        return len(self._titles.texts)
+
+    def _diff(self, titles: list[str], descriptions: list[str]) -> tuple[array, list[int]]:
+        """Maps each old position to its new one, or -1 if the challenge is gone,
+        and lists the new positions of the challenges that are new.
+        """
+        remap = array("i", [-1]) * len(self)
+        old: dict[tuple[str, str], list[int]] = defaultdict(list)
+        for i in reversed(range(len(self))):
+            old[self._titles.texts[i], self._descriptions.texts[i]].append(i)
+        added = []
+        for j, key in enumerate(zip(titles, descriptions)):
+            positions = old.get(key)
+            if positions:
+                remap[positions.pop()] = j
+            else:
+                added.append(j)
+        return remap, added
+
+    def search(self, query: str, limit: int = 25) -> list[Challenge]:
+        """Challenges whose title, then whose description, contains `query`."""
+        query = normalize(query)
+        if not query:
+            found = list(range(min(limit, len(self))))
+        elif len(query) < 3:
+            found = self._prefix(query, limit)
+        else:
+            found = self._titles.search(query, limit, set())
+            if len(found) < limit:
+                found += self._descriptions.search(query, limit - len(found), set(found))
+        return [self.catalog.pool[i] for i in found]
+
+    def _prefix(self, prefix: str, limit: int) -> list[int]:
+        found: dict[int, None] = {}
+        k = bisect_left(self._words, prefix)
+        while k < len(self._words) and len(found) < limit and self._words[k].startswith(prefix):
+            found[self._word_positions[k]] = None
+            k += 1
+        return list(found)
+
+    def find(self, title: str) -> Optional[Challenge]:
+        """The challenge with this title, ignoring case and spacing."""
+        i = self._exact.get(normalize(title))
+        return None if i is None else self.catalog.pool[i]
+
+
+_index: Optional[SearchIndex] = None
+_building: Optional[asyncio.Task] = None
+
+
+async def _build():
+    global _index
+    catalog = await ensure_catalog()
+    if _index is None or _index.catalog.version != catalog.version:
+        _index = await asyncio.to_thread(SearchIndex, catalog, _index)
+
+
+def refresh_index() -> Optional[asyncio.Task]:
+    """Starts indexing the current catalog off the event loop, unless it is already indexed."""
+    global _building
+    catalog = loaded_catalog()
+    if _index is not None and catalog is not None and _index.catalog.version == catalog.version:
+        return None
+    if _building is None or _building.done():
+        _building = asyncio.create_task(_build())
+    return _building
+
+
+async def get_index() -> SearchIndex:
+    """Returns the newest index. Only the first build is waited for: after a
+    reload, the previous index keeps answering until the new one is ready.
+    """
+    task = refresh_index()
+    if _index is None:
+        assert task is not None
+        await task
+    assert _index is not None
+    return _index
@@ -1,10 +1,25 @@
 import asyncio
 from collections.abc import Callable, Sequence
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, fields
 import functools
 import inspect
+import io
+import logging
 from typing import Any, Awaitable, Optional
-from snake_game import Challenge, SnakeGame, Settings, InterfaceMethods, GameError, load_challenges
+from snake_game import Challenge, SnakeGame, Settings, GameError, ExpiredCycleError
+from events import ChallengeCompleted, CycleStarted, CycleWarning, GameEnded
+from journal import GameJournal, GameRecord, open_journal, replay
+from config import GuildConfig, load_guild_configs
+from catalog import CatalogError, reload_catalog, watch_catalog
+from scheduler import get_scheduler
+from outbox import Priority, get_outbox
+from teardown import TeardownJob, get_teardown
+from roles import RolePool
+from search import get_index, refresh_index
+from stats import GameStats, StatsStore
+import metrics
+from metrics import COMPLETIONS, DISCORD_LATENCY, EXPIRED_CYCLE_ERRORS, REJECTED_CLICKS, timed_lock
+from watchdog import LoopWatchdog, profile_loop
 from dotenv import load_dotenv
 import os
 
@@ -13,177 +28,389 @@ import discord
 
 load_dotenv()
 
+MEMBERSHIP_CONCURRENCY = 8
+MIN_TEAMS = 2
+MAX_TEAMS = 32
+# Discord rejects messages with longer content
+MESSAGE_LIMIT = 2000
+
 
 @dataclass
 class Team:
     id: int
     team_role: discord.Role
     thread: Optional[discord.Thread] = None
-    members: list[discord.Member] = field(default_factory=list)
+    # Player ID -> the member object from their interaction, or None if it has to be
+    # fetched when needed, e.g. after a restart
+    members: dict[int, Optional[discord.Member]] = field(default_factory=dict)
 
-    async def remove_roles(self):
-        async with asyncio.TaskGroup() as tg:
-            for member in self.members:
-                tg.create_task(member.remove_roles(self.team_role))
+
+CUSTOM_ID_PREFIX = "snake"
 
 
-class ChallengeView(discord.ui.View):
-    def __init__(self, game: "DiscordSnakeGame", challenge_id: int, cycle_id: int, timeout: int):
-        super().__init__(timeout=timeout, disable_on_timeout=True)
-        self._game = game
-        self.challenge_id = challenge_id
-        self.cycle_id = cycle_id
+def challenge_custom_id(game_id: int, cycle_id: int, challenge_id: int) -> str:
+    return f"{CUSTOM_ID_PREFIX}:{game_id}:{cycle_id}:{challenge_id}"
 
-    @discord.ui.button(label="Complete Challenge", style=discord.ButtonStyle.green)
-    async def complete_challenge(self, _: discord.ui.Button, interaction: discord.Interaction):
-        await self._game._complete_challenge(interaction, self.challenge_id, self.cycle_id)
 
-    async def on_timeout(self) -> None:
-        await self.disable_view()
+def parse_challenge_custom_id(custom_id: str) -> Optional[tuple[int, int, int]]:
+    """Returns the game, cycle and challenge IDs of a challenge button, or None for other components."""
+    parts = custom_id.split(":")
+    if len(parts) != 4 or parts[0] != CUSTOM_ID_PREFIX:
+        return None
+    try:
+        return int(parts[1]), int(parts[2]), int(parts[3])
+    except ValueError:
+        return None
 
-    async def disable_view(self) -> None:
-        assert self.message is not None
-        self.disable_all_items()
-        await self.message.edit(view=self)
+
+@dataclass
+class ChallengeMessage:
+    """A message with "Complete" buttons for the challenges in `challenge_ids`."""
+    content: str
+    cycle_id: int
+    challenge_ids: list[int]
+    view: Optional[discord.ui.View] = None
+    message: Optional[discord.Message | discord.PartialMessage] = None
+
+
+@dataclass
+class StagedBroadcast:
+    """A cycle's challenge messages, rendered ahead of the tick that reveals them."""
+    cycle_id: int
+    messages: list[ChallengeMessage]
 
 
 class DiscordSnakeGame:
-    def __init__(self, thread: discord.Thread, game_id: int, team_roles: Sequence[discord.Role]) -> None:
-        self._game_id = game_id  # NOTE: Currently unused
+    def __init__(self, thread: discord.Thread, game_id: int, team_roles: Sequence[discord.Role],
+                 journal: Optional[GameJournal] = None, role_pool: Optional[RolePool] = None,
+                 stats: Optional[GameStats] = None) -> None:
+        self._game_id = game_id
+        self._journal = journal
         self._general_thread: discord.Thread = thread
         self._challenge_countdown_done = asyncio.Event()
         self._challenge_countdown_done.set()
 
-        self._challenge_view_lock = asyncio.Lock()
-        self._active_challenge_views: list[ChallengeView] = []
+        # Sent messages whose buttons are still enabled
+        self._active_challenge_messages: list[ChallengeMessage] = []
+        self._staged_broadcast: Optional[StagedBroadcast] = None
+        # A cycle whose challenges were not sent because the game was paused
+        self._unsent_cycle_id: Optional[int] = None
 
         self._pre_game_lock = asyncio.Lock()
         self._players = {}
-        self._teams = [Team(0, team_roles[0]),
-                       Team(1, team_roles[1])]
-        self._settings = Settings()
-
-        self._interface = InterfaceMethods(
-            broadcast_challenges=self._broadcast_challenges,
-            warning_ping=self._warning_ping
-        )
+        # Role assignment and general thread membership for new players
+        self._membership_tasks: set[asyncio.Task] = set()
+        self._membership_slots = asyncio.Semaphore(MEMBERSHIP_CONCURRENCY)
+        self._teams = [Team(i, role) for i, role in enumerate(team_roles)]
+        self._role_pool = role_pool or RolePool()
+        self._settings = Settings(num_teams=len(self._teams))
+        self._scheduler = get_scheduler()
+        self._outbox = get_outbox()
+        self._teardown = get_teardown()
+
         self._game = SnakeGame(settings=self._settings,
-                               interface=self._interface)
+                               scheduler=self._scheduler,
+                               journal=journal,
+                               stats=stats)
+        self._events = self._game.events.subscribe()
+        self._event_task: Optional[asyncio.Task] = None
+        self._warning_task: Optional[asyncio.Task] = None
+        self._release_tasks: set[asyncio.Task] = set()
+
+    @classmethod
+    async def restore(cls, client: discord.Client, record: GameRecord, journal: Optional[GameJournal] = None,
+                      role_pool: Optional[RolePool] = None, stats: Optional[GameStats] = None) -> "DiscordSnakeGame":
+        """Rebuilds a game and its teams from the journal after a restart."""
+        async def get_thread(thread_id: int) -> discord.Thread:
+            thread = client.get_channel(thread_id) or await client.fetch_channel(thread_id)
+            assert isinstance(thread, discord.Thread)
+            return thread
+
+        thread = await get_thread(record.thread_id)
+        guild = thread.guild
+        roles = [guild.get_role(i) for i in record.team_role_ids]
+        if None in roles:
+            raise GameError("A team role no longer exists")
+        game = cls(thread, record.game_id, roles, journal, role_pool, stats)
+        game._role_pool.claim(guild, game._team_roles())
+
+        setting_names = {f.name for f in fields(Settings)}
+        for name, value in record.settings.items():
+            if name in setting_names:
+                setattr(game._settings, name, value)
+
+        async with asyncio.TaskGroup() as tg:
+            thread_tasks = {team_id: tg.create_task(get_thread(thread_id))
+                            for team_id, thread_id in record.team_thread_ids.items()}
+        for team_id, task in thread_tasks.items():
+            game._teams[team_id].thread = task.result()
+        for user_id, team_id in record.players.items():
+            game._players[user_id] = team_id
+            game._teams[team_id].members[user_id] = None
+
+        if record.started:
+            game._start_events()
+            await game._game.restore_game(record)
+            if record.challenge_messages:
+                # Their buttons still work, they only need disabling once the cycle ends
+                game._active_challenge_messages = [
+                    ChallengeMessage("", record.cycle_id, m["challenge_ids"],
+                                     message=thread.get_partial_message(m["message_id"]))
+                    for m in record.challenge_messages]
+            else:
+                game._events.publish(CycleStarted(record.cycle_id))
+        return game
+
+    def _record(self, event: str, **data: Any):
+        if self._journal is not None:
+            self._journal.record(event, **data)
 
     async def _create_team_thread(self, ctx: discord.ApplicationContext, team: Team):
         assert isinstance(ctx.channel, discord.Thread)
         assert isinstance(ctx.channel.parent, discord.TextChannel)
 
-        team.thread = await ctx.channel.parent.create_thread(name=f"Snake Team {team.id + 1}", invitable=False)
+        with DISCORD_LATENCY.time(operation="create_thread"):
+            team.thread = await ctx.channel.parent.create_thread(name=f"Snake Team {team.id + 1}", invitable=False)
         assert team.thread is not None
+        self._record("team_thread_created", team=team.id, thread_id=team.thread.id)
 
         async with asyncio.TaskGroup() as tg:
-            for user in team.members:
-                tg.create_task(self._general_thread.add_user(user))
-                tg.create_task(team.thread.add_user(user))
+            for user_id in team.members:
+                tg.create_task(team.thread.add_user(discord.Object(user_id)))
 
     async def _create_threads(self, ctx: discord.ApplicationContext):
         async with asyncio.TaskGroup() as tg:
             for team in self._teams:
-                tg.create_task(self._create_team_thread(ctx, team))
+                # Empty teams can never be frozen, so they need no thread
+                if team.members:
+                    tg.create_task(self._create_team_thread(ctx, team))
 
     async def _countdown(self, message_str: str, time: int):
         if self._game.has_ended:
             return
 
+        # Every countdown second is a deadline on the shared scheduler, so all
+        # running countdowns are woken together instead of by their own sleeps
+        start = self._scheduler.now()
         async with asyncio.TaskGroup() as tg:
-            tg.create_task(asyncio.sleep(1))
+            tg.create_task(self._scheduler.sleep_until(start + 1))
             message_task = tg.create_task(
-                self._general_thread.send(
-                    f"## {message_str} in {time}...\n-# ||{''.join([i.team_role.mention for i in self._teams])}||"
+                self._outbox.send(
+                    self._general_thread,
+                    f"## {message_str} in {time}...\n-# ||{''.join([i.team_role.mention for i in self._teams])}||",
+                    priority=Priority.NORMAL
                 )
             )
         message = await message_task
 
-        for i in range(time - 1, 0, -1):
-            if self._game.has_ended:
-                break
-
-            async with asyncio.TaskGroup() as tg:
-                tg.create_task(message.edit(
-                    content=f"## {message_str} in {i}..."))
-                tg.create_task(asyncio.sleep(1))
-
-        await message.delete()
+        try:
+            for i in range(time - 1, 0, -1):
+                if self._game.has_ended:
+                    break
+
+                # Not awaited: if the channel is backed up, a newer second simply
+                # replaces the edit that has not gone out yet
+                self._outbox.edit(message, content=f"## {message_str} in {i}...")
+                await self._scheduler.sleep_until(start + time - i + 1)
+        finally:
+            # Also when the countdown is cancelled because the game ended
+            await self._outbox.delete(message)
 
     def _is_player(self, user: discord.abc.Snowflake):
         return user.id in self._players
 
+    async def _get_member(self, user: discord.abc.Snowflake) -> discord.Member:
+        # Interactions carry the member, unless the guild itself is not cached
+        if isinstance(user, discord.Member):
+            return user
+        guild = self._general_thread.guild
+        return guild.get_member(user.id) or await guild.fetch_member(user.id)
+
     async def join_game(self, ctx: discord.ApplicationContext, team_id: int):
-        assert isinstance(ctx.user, discord.Member)
+        assert ctx.user is not None
 
-        async with self._pre_game_lock:
-            if self._game.has_started:
-                await ctx.respond("The game has already started", ephemeral=True)
-                return
-            if ctx.user.id in self._players:
-                await ctx.respond("You have already joined the game", ephemeral=True)
-                return
+        # Joining only touches memory, so it needs no lock and never waits on
+        # other joins; the Discord side is left to the membership batch
+        if self._game.has_started:
+            await ctx.respond("The game has already started", ephemeral=True)
+            return
+        if ctx.user.id in self._players:
+            await ctx.respond("You have already joined the game", ephemeral=True)
+            return
 
-            true_team_id = team_id - 1
-            if not 0 <= true_team_id < len(self._teams):
-                await ctx.respond(f"Invalid team ID", ephemeral=True)
-                return
-            team = self._teams[true_team_id]
+        true_team_id = team_id - 1
+        if not 0 <= true_team_id < len(self._teams):
+            await ctx.respond(f"Invalid team ID", ephemeral=True)
+            return
+        team = self._teams[true_team_id]
 
-            self._players[ctx.user.id] = true_team_id
-            team.members.append(ctx.user)
-            await ctx.user.add_roles(self._teams[true_team_id].team_role)
-            await ctx.respond(f"You have joined Team {team_id}", ephemeral=True)
+        self._players[ctx.user.id] = true_team_id
+        team.members[ctx.user.id] = ctx.user if isinstance(ctx.user, discord.Member) else None
+        self._record("player_joined", user_id=ctx.user.id, team=true_team_id)
+        self._queue_membership(ctx.user, team)
+        await ctx.respond(f"You have joined Team {team_id}", ephemeral=True)
+
+    def _queue_membership(self, member: discord.abc.Snowflake, team: Team):
+        task = asyncio.create_task(self._add_membership(member, team))
+        self._membership_tasks.add(task)
+        task.add_done_callback(self._membership_tasks.discard)
+
+    async def _add_membership(self, user: discord.abc.Snowflake, team: Team):
+        async with self._membership_slots:
+            try:
+                member = team.members[user.id] = await self._get_member(user)
+                async with asyncio.TaskGroup() as tg:
+                    tg.create_task(self._time_call("add_roles", member.add_roles(team.team_role)))
+                    tg.create_task(self._time_call("add_user", self._general_thread.add_user(member)))
+            except* discord.HTTPException:
+                logging.exception(f"Failed to add {user.id} to Team {team.id + 1} of game {self._game_id}")
+
+    @staticmethod
+    async def _time_call(operation: str, awaitable: Awaitable[Any]) -> Any:
+        with DISCORD_LATENCY.time(operation=operation):
+            return await awaitable
+
+    async def _wait_for_memberships(self):
+        while self._membership_tasks:
+            await asyncio.gather(*self._membership_tasks)
 
     def _get_team(self, user: discord.abc.Snowflake) -> Team:
         return self._teams[self._players[user.id]]
 
-    async def start_game(self, ctx: discord.ApplicationContext):
-        async with self._pre_game_lock:
+    async def start_game(self, ctx: discord.ApplicationContext, seed: Optional[int] = None):
+        async with timed_lock(self._pre_game_lock, "pre_game"):
             if len(self._players) < 1:
                 await ctx.respond("You need at least one player in order to start the game.", ephemeral=True)
                 return
             if self._game.has_started:
                 await ctx.respond("The game has already started", ephemeral=True)
                 return
-            await self._game.enter_starting_state()
+            try:
+                await self._game.enter_starting_state(seed)
+            except GameError as e:
+                await ctx.respond(f"**Error:** {e}", ephemeral=True)
+                return
 
-        await ctx.respond("Starting game...", ephemeral=True)
+        await ctx.respond("Starting game..." if seed is None else f"Starting game with seed {seed}...", ephemeral=True)
+        # No one can join any more, so this only waits for the joins in flight
+        await self._wait_for_memberships()
         await self._create_threads(ctx)
         await self._countdown("Game starts", 5)
+        self._start_events()
         await self._game.start_game()
-        await self._broadcast_challenges(0)
 
-    async def _disable_views(self):
-        assert self._challenge_view_lock.locked()
+    async def pause_game(self, ctx: discord.ApplicationContext):
+        try:
+            await self._game.pause_game()
+        except GameError as e:
+            await ctx.respond(f"**Error:** {e}", ephemeral=True)
+            return
+        await ctx.respond("## Game paused")
+
+    async def resume_game(self, ctx: discord.ApplicationContext):
+        try:
+            await self._game.resume_game()
+        except GameError as e:
+            await ctx.respond(f"**Error:** {e}", ephemeral=True)
+            return
+        # Published before responding, so that no tick can come in between
+        if self._unsent_cycle_id is not None:
+            self._events.publish(CycleStarted(self._unsent_cycle_id))
+        await ctx.respond("## Game resumed")
+
+    def _challenge_view(self, cycle_id: int, challenge_ids: list[int], disabled: bool = False) -> discord.ui.View:
+        # Clicks are dispatched by the interaction router through the buttons'
+        # custom IDs, so pycord never needs to store or time out the view
+        view = discord.ui.View(timeout=None, store=False)
+        for i in challenge_ids:
+            label = f"Complete #{i + 1}" if self._settings.combined_broadcast else "Complete Challenge"
+            view.add_item(discord.ui.Button(
+                label=label, style=discord.ButtonStyle.green, disabled=disabled,
+                custom_id=challenge_custom_id(self._game_id, cycle_id, i)))
+        return view
+
+    def _take_messages(self) -> list[ChallengeMessage]:
+        # Message bookkeeping never awaits, so swapping the list out is atomic
+        messages, self._active_challenge_messages = self._active_challenge_messages, []
+        return messages
+
+    async def _disable_messages(self, messages: list[ChallengeMessage]):
         async with asyncio.TaskGroup() as tg:
-            for view in self._active_challenge_views:
-                tg.create_task(view.disable_view())
-        self._active_challenge_views.clear()
+            for m in messages:
+                tg.create_task(self._disable_message(m))
+
+    async def _disable_message(self, message: ChallengeMessage):
+        assert message.message is not None
+        view = self._challenge_view(message.cycle_id, message.challenge_ids, disabled=True)
+        await self._outbox.edit(message.message, view=view, priority=Priority.NORMAL)
+
+    async def _track_message(self, message: ChallengeMessage):
+        # The cycle may have been won or replaced while its message was being sent
+        if self._game.is_cycle_open(message.cycle_id):
+            self._active_challenge_messages.append(message)
+            assert message.message is not None
+            self._record("challenge_message_sent", cycle_id=message.cycle_id,
+                         message_id=message.message.id, challenge_ids=message.challenge_ids)
+        else:
+            await self._disable_message(message)
 
     async def end_game(self, ctx: discord.ApplicationContext):
         if not self._game.is_active:
             await ctx.respond("Cannot end a game that is not active", ephemeral=True)
             return
-        
-        async def locking_disable_views():
-            async with self._challenge_view_lock:
-                await self._disable_views()
 
         await self._game.end_game()
         await ctx.respond("Ending game...", ephemeral=True)
 
         async with asyncio.TaskGroup() as tg:
-            tg.create_task(locking_disable_views())
-            tg.create_task(self._general_thread.send("# Game Over!"))
-            for team in self._teams:
-                assert team.thread is not None
-                tg.create_task(team.remove_roles())
-                tg.create_task(team.thread.archive(locked=True))
+            tg.create_task(self._disable_messages(self._take_messages()))
+            tg.create_task(self._outbox.send(self._general_thread, "# Game Over!"))
+        self.teardown()
+
+    def teardown(self) -> TeardownJob:
+        """Hands archiving the team threads and removing the team roles to the shared teardown."""
+        calls = []
+        for team in self._teams:
+            if team.thread is not None:
+                calls.append(functools.partial(team.thread.archive, locked=True))
+            calls.extend(functools.partial(self._remove_team_role, team, user_id) for user_id in team.members)
+        job = self._teardown.submit(self._game_id, f"Game {self._game_id}", calls)
+        task = asyncio.create_task(self._release_roles(job))
+        self._release_tasks.add(task)
+        task.add_done_callback(self._release_tasks.discard)
+        return job
+
+    async def _remove_team_role(self, team: Team, user_id: int):
+        member = team.members[user_id] or await self._get_member(discord.Object(user_id))
+        await member.remove_roles(team.team_role)
+
+    def _team_roles(self) -> list[discord.Role]:
+        return [team.team_role for team in self._teams]
+
+    async def _release_roles(self, job: TeardownJob):
+        # A role can only be reused once no member holds it any more
+        await job.finished.wait()
+        if job.failed:
+            logging.warning(f"Not reusing the team roles of game {self._game_id}: "
+                            f"{job.failed} clean-up calls failed")
+            return
+        self._role_pool.release(self._general_thread.guild, self._team_roles())
+
+    async def _resize_teams(self, num_teams: int):
+        guild = self._general_thread.guild
+        if num_teams > len(self._teams):
+            roles = await self._role_pool.acquire(guild, num_teams - len(self._teams))
+            self._teams.extend(Team(len(self._teams) + i, role) for i, role in enumerate(roles))
+        elif num_teams < len(self._teams):
+            removed = self._teams[num_teams:]
+            if any(team.members for team in removed):
+                raise GameError("Cannot remove a team that has players")
+            del self._teams[num_teams:]
+            self._role_pool.release(guild, [team.team_role for team in removed])
+        self._record("teams_changed", team_role_ids=[r.id for r in self._team_roles()])
 
     async def set_setting(self, ctx: discord.ApplicationContext, setting_name: str, new_val: Any):
-        async with self._pre_game_lock:
+        async with timed_lock(self._pre_game_lock, "pre_game"):
             if self._game.has_started:
                 await ctx.respond("Cannot change settings for a in-progress game", ephemeral=True)
                 return
@@ -201,24 +428,66 @@ class DiscordSnakeGame:
                         return
                     self._settings.cycle_length = new_val
                     await ctx.respond(f"cycle_length has been set to {new_val}")
+                case "combined_broadcast":
+                    self._settings.combined_broadcast = new_val
+                    await ctx.respond(f"combined_broadcast has been set to {new_val}")
+                case "category" | "difficulty":
+                    # An empty string clears the filter
+                    setattr(self._settings, setting_name, new_val or None)
+                    await ctx.respond(f"{setting_name} has been set to {new_val or 'any'}")
+                case "weighted":
+                    self._settings.weighted = new_val
+                    await ctx.respond(f"weighted has been set to {new_val}")
+                case "num_teams":
+                    if not MIN_TEAMS <= new_val <= MAX_TEAMS:
+                        await ctx.respond(f"**Error:** num_teams must be between {MIN_TEAMS} and {MAX_TEAMS}", ephemeral=True)
+                        return
+                    try:
+                        await self._resize_teams(new_val)
+                    except GameError as e:
+                        await ctx.respond(f"**Error:** {e}", ephemeral=True)
+                        return
+                    except discord.HTTPException as e:
+                        await ctx.respond(f"**Error:** Could not create the team roles: {e}", ephemeral=True)
+                        return
+                    self._settings.num_teams = new_val
+                    await ctx.respond(f"num_teams has been set to {new_val}")
                 case _:
                     raise GameError("Unknown setting")
+            self._record("setting_changed", name=setting_name,
+                         value=getattr(self._settings, setting_name))
 
     async def get_setting(self, setting_name: str):
-        async with self._pre_game_lock:
+        async with timed_lock(self._pre_game_lock, "pre_game"):
             match setting_name:
                 case "num_challenges":
                     return self._settings.num_challenges
                 case "cycle_length":
                     return self._settings.cycle_length
+                case "combined_broadcast":
+                    return self._settings.combined_broadcast
+                case "category" | "difficulty":
+                    return getattr(self._settings, setting_name) or "any"
+                case "weighted":
+                    return self._settings.weighted
+                case "num_teams":
+                    return self._settings.num_teams
                 case _:
                     raise GameError("Unknown setting")
 
-    async def _send_freeze(self, team: Team, next_challenges: list[Challenge]):
-        assert team.thread is not None
-        await team.thread.send(f"## {team.team_role.mention} You have been frozen!\nThe upcoming challenges are:")
-        for c in next_challenges:
-            await team.thread.send(format_challenge(c))
+    async def _send_freezes(self, teams: list[Team], next_challenges: list[Challenge]):
+        # One message per team, rendered once and sent to every team at the same time
+        freeze = format_freeze(next_challenges)
+
+        async def send_freeze(team: Team):
+            assert team.thread is not None
+            for content in split_message(f"## {team.team_role.mention} {freeze}"):
+                await self._outbox.send(team.thread, content)
+
+        async with asyncio.TaskGroup() as tg:
+            for team in teams:
+                if team.thread is not None:
+                    tg.create_task(send_freeze(team))
 
     async def _complete_challenge(self, interaction: discord.Interaction, challenge_id: int, cycle_id: int):
         assert interaction.user is not None
@@ -226,87 +495,256 @@ class DiscordSnakeGame:
             await interaction.respond("You are not playing in this game. You cannot complete the challenge.", ephemeral=True)
             return
 
-        async with self._challenge_view_lock:
-            try:
-                challenge, next_challenges = await self._game.complete_challenge(challenge_id, cycle_id)
-            except GameError as e:
-                await interaction.response.send_message(f"{e}", ephemeral=True)
-                return
-            else:
-                await self._disable_views()
-
         completed_team = self._get_team(interaction.user)
-        victim_teams = [v for i, v in enumerate(
-            self._teams) if i != completed_team.id]
-
+        try:
+            challenge, _ = self._game.complete_challenge(
+                challenge_id, cycle_id, player_id=interaction.user.id, team_id=completed_team.id)
+        except GameError as e:
+            REJECTED_CLICKS.inc(game=self._game_id)
+            if isinstance(e, ExpiredCycleError):
+                EXPIRED_CYCLE_ERRORS.inc(game=self._game_id)
+            await interaction.response.send_message(f"{e}", ephemeral=True)
+            return
+        COMPLETIONS.inc(game=self._game_id)
+        # Disabling the buttons and freezing the other teams follow from the game's event
+        await interaction.respond(
+            f"{completed_team.team_role.mention} has completed the challenge: {challenge.title}!\nAll other teams have been frozen!")
+
+    async def _on_challenge_completed(self, event: ChallengeCompleted):
+        messages = self._take_messages()
+        victim_teams = [team for team in self._teams if team.id != event.team_id]
         async with asyncio.TaskGroup() as tg:
-            tg.create_task(interaction.respond(
-                f"{completed_team.team_role.mention} has completed the challenge: {challenge.title}!\nAll other teams have been frozen!"))
-            for team in victim_teams:
-                tg.create_task(self._send_freeze(team, next_challenges))
+            tg.create_task(self._disable_messages(messages))
+            tg.create_task(self._send_freezes(victim_teams, event.next_challenges))
 
     async def _broadcast_challenges(self, cycle_id: int):
         await self._challenge_countdown_done.wait()
-        async with self._challenge_view_lock, self._general_thread.typing():
-            assert self._game.has_started
-            if not self._game.is_playing:
+        assert self._game.has_started
+        if not self._game.is_playing:
+            # Sent when the game is resumed
+            self._unsent_cycle_id = cycle_id
+            return
+        self._unsent_cycle_id = None
+        if cycle_id != self._game.cycle_id:
+            # A newer cycle has started, and its own event broadcasts it
+            return
+
+        staged, self._staged_broadcast = self._staged_broadcast, None
+        if staged is None or staged.cycle_id != cycle_id:
+            # Nothing was staged, e.g. for the first cycle or after a restore
+            challenges = await self._game.get_current_challenges()
+            if cycle_id != self._game.cycle_id:
                 return
+            staged = self._render_broadcast(cycle_id, challenges)
+        old_messages = self._take_messages()
 
-            async with asyncio.TaskGroup() as tg:
-                tg.create_task(self._disable_views())
-                challenges_task = tg.create_task(
-                    self._game.get_current_challenges())
-            challenges = await challenges_task
+        async def send_challenges():
+            for m in staged.messages:
+                m.message = await self._outbox.send(self._general_thread, m.content, view=m.view)
+                if m.challenge_ids:
+                    await self._track_message(m)
 
-            await self._general_thread.send("## Challenges")
-            for i, c in enumerate(challenges):
-                view = ChallengeView(
-                    self, i, cycle_id, self._settings.cycle_length + 10)
-                self._active_challenge_views.append(view)
-                await self._general_thread.send(format_challenge(c), view=view)
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(self._disable_messages(old_messages))
+            tg.create_task(send_challenges())
 
-    async def _warning_ping(self):
-        assert self._game.has_started
+    def _render_broadcast(self, cycle_id: int, challenges: list[Challenge]) -> StagedBroadcast:
+        content = format_challenge_set(challenges) if self._settings.combined_broadcast else None
+        if content is not None and len(content) <= MESSAGE_LIMIT:
+            messages = [ChallengeMessage(content, cycle_id, list(range(len(challenges))))]
+        else:
+            # Also used when the combined message would be too long for Discord
+            messages = [ChallengeMessage("## Challenges", cycle_id, [])]
+            for i, c in enumerate(challenges):
+                # A challenge too long for one message is split, with its button on the last part
+                *parts, last = split_message(format_challenge(c))
+                messages.extend(ChallengeMessage(part, cycle_id, []) for part in parts)
+                messages.append(ChallengeMessage(last, cycle_id, [i]))
+        for m in messages:
+            if m.challenge_ids:
+                m.view = self._challenge_view(cycle_id, m.challenge_ids)
+        return StagedBroadcast(cycle_id, messages)
+
+    def _on_warning(self, cycle_id: int):
+        next_cycle_id, challenges = self._game.peek_next_cycle()
+        if next_cycle_id != cycle_id:
+            return
+        # The next cycle's challenges are already known, so everything but the
+        # sends is done before the countdown instead of after the tick
+        self._staged_broadcast = self._render_broadcast(cycle_id, challenges)
         self._challenge_countdown_done.clear()
-        await self._countdown("New challenges", self._settings.warning_time)
-        self._challenge_countdown_done.set()
+        self._warning_task = asyncio.create_task(self._warning_countdown())
+
+    async def _warning_countdown(self):
+        try:
+            await self._countdown("New challenges", self._settings.warning_time)
+        finally:
+            self._challenge_countdown_done.set()
+
+    def _start_events(self):
+        assert self._event_task is None
+        self._event_task = asyncio.create_task(self._consume_events())
+
+    async def _consume_events(self):
+        # Events are handled one at a time, in order; the game itself never
+        # waits for any of this, and events that go stale in the meantime are dropped
+        async for event in self._events:
+            try:
+                match event:
+                    case CycleStarted(cycle_id=cycle_id):
+                        await self._broadcast_challenges(cycle_id)
+                    case CycleWarning(cycle_id=cycle_id):
+                        self._on_warning(cycle_id)
+                    case ChallengeCompleted():
+                        await self._on_challenge_completed(event)
+                    case GameEnded():
+                        if self._warning_task is not None:
+                            self._warning_task.cancel()
+            except Exception:
+                logging.exception(f"Failed to handle {event} in game {self._game_id}")
 
 
 def format_challenge(challenge: Challenge) -> str:
     return f"### {challenge.title}\n{challenge.description}"
 
 
-# NOTE: Currently only supports one guild at a time
-GUILD_IDS = [1412516526447268075]
-# NOTE: Currently only supports two team roles
-TEAM_ROLES_IDS = [1412516839711576144, 1412516873534308446]
+def format_freeze(next_challenges: Sequence[Challenge]) -> str:
+    return "You have been frozen!\nThe upcoming challenges are:\n" + "\n".join(
+        format_challenge(c) for c in next_challenges)
+
+
+def split_message(content: str, limit: int = MESSAGE_LIMIT) -> list[str]:
+    """Splits `content` between lines into messages Discord accepts."""
+    messages: list[str] = []
+    current = ""
+    for line in content.split("\n"):
+        while len(line) > limit:
+            if current:
+                messages.append(current)
+                current = ""
+            messages.append(line[:limit])
+            line = line[limit:]
+        if current and len(current) + 1 + len(line) > limit:
+            messages.append(current)
+            current = line
+        else:
+            current = f"{current}\n{line}" if current else line
+    if current:
+        messages.append(current)
+    return messages
+
+
+def format_challenge_set(challenges: Sequence[Challenge]) -> str:
+    return "## Challenges\n" + "\n".join(
+        f"### #{i + 1}: {c.title}\n{c.description}" for i, c in enumerate(challenges))
+
+
+DEFAULT_GUILD_CONFIGS = {
+    1412516526447268075: GuildConfig(1412516526447268075, [1412516839711576144, 1412516873534308446]),
+}
+GUILD_CONFIGS = load_guild_configs() or DEFAULT_GUILD_CONFIGS
+GUILD_IDS = list(GUILD_CONFIGS)
+
+
+def serves_guild(client: discord.Client, guild_id: int) -> bool:
+    """Whether a guild's events go to one of this process's shards."""
+    shard_count = getattr(client, "shard_count", None)
+    shard_ids = getattr(client, "shard_ids", None)
+    if not shard_count or shard_ids is None:
+        return True
+    return (guild_id >> 22) % shard_count in shard_ids
 
 
-# TODO: Make this work with multiple games
-# TODO: Make this work with multiple threads per game
 class GameManager:
-    _game_threads: dict[int, DiscordSnakeGame]
+    # Guild ID -> general thread ID -> game
+    _games: dict[int, dict[int, DiscordSnakeGame]]
+
+    def __init__(self, guild_configs: dict[int, GuildConfig]) -> None:
+        self._guild_configs = guild_configs
+        self._games = {}
+        self._creating: dict[int, int] = {}
+        self._journal = open_journal()
+        self.stats = StatsStore()
+        self._role_pool = RolePool(i for c in guild_configs.values() for i in c.team_role_ids)
+        self._recovered = False
+
+    def _get_game(self, ctx: discord.ApplicationContext) -> Optional[DiscordSnakeGame]:
+        return self._games.get(ctx.guild_id, {}).get(ctx.channel.id)
+
+    def _add_game(self, guild_id: int, thread_id: int, game: DiscordSnakeGame):
+        self._games.setdefault(guild_id, {})[thread_id] = game
+
+    async def recover(self, client: discord.Client):
+        """Restores every game of this process's guilds that was still running when the bot last stopped."""
+        if self._recovered:
+            return
+        self._recovered = True
 
-    def __init__(self) -> None:
-        self._game_threads = {}
+        records = await asyncio.to_thread(self._load_journal)
+        self._journal.start()
+        # Creating the schema can wait on another process's write lock
+        await asyncio.to_thread(self.stats.start)
+        # Other processes restore the games of the guilds on their shards
+        records = {k: r for k, r in records.items() if serves_guild(client, r.guild_id)}
+
+        async def restore(record: GameRecord):
+            journal = self._journal.for_game(record.game_id)
+            try:
+                game = await DiscordSnakeGame.restore(client, record, journal, self._role_pool,
+                                                      self.stats.for_game(record.game_id, record.guild_id))
+            except (discord.HTTPException, GameError) as e:
+                logging.error(f"Could not restore game {record.game_id}: {e}")
+                journal.record("game_ended")
+            else:
+                self._add_game(record.guild_id, record.thread_id, game)
+
+        async with asyncio.TaskGroup() as tg:
+            for record in records.values():
+                tg.create_task(restore(record))
+        if records:
+            restored = sum(len(games) for games in self._games.values())
+            logging.info(f"Restored {restored} of {len(records)} games")
+
+    def _load_journal(self) -> dict[int, GameRecord]:
+        records = replay(self._journal.read())
+        # Ended games are dropped so the journal only grows with live games
+        self._journal.compact([e for r in records.values() for e in r.events])
+        return records
+
+    def close(self):
+        self._journal.close()
+        self.stats.close()
 
     async def create_game(self, ctx: discord.ApplicationContext):
         if isinstance(ctx.channel, discord.Thread):
             await ctx.respond("Cannot create a game in a thread", ephemeral=True)
             return
-        if len(self._game_threads) >= 1:
-            await ctx.respond("Oops, this game only supports one at the time atm.", ephemeral=True)
+        guild_id = ctx.guild.id
+        config = self._guild_configs.get(guild_id) or GuildConfig(guild_id)
+        # Games still being created count too, as creating one awaits Discord
+        running = len(self._games.get(guild_id, {})) + self._creating.get(guild_id, 0)
+        if running >= config.max_games:
+            await ctx.respond(f"This server can only run {config.max_games} game(s) at a time.", ephemeral=True)
             return
 
-        await ctx.respond("Creating game...", ephemeral=True)
-
-        thread = await ctx.channel.create_thread(name="Snake General", type=discord.ChannelType.public_thread)
-        game = DiscordSnakeGame(
-            thread, 0, [ctx.guild.get_role(i) for i in TEAM_ROLES_IDS])
-        self._game_threads[thread.id] = game
+        self._creating[guild_id] = self._creating.get(guild_id, 0) + 1
+        try:
+            await ctx.respond("Creating game...", ephemeral=True)
+
+            with DISCORD_LATENCY.time(operation="create_thread"):
+                thread = await ctx.channel.create_thread(name="Snake General", type=discord.ChannelType.public_thread)
+            roles = await self._role_pool.acquire(ctx.guild, Settings.num_teams)
+            journal = self._journal.for_game(thread.id)
+            journal.record("game_created", guild_id=guild_id, channel_id=ctx.channel.id,
+                           thread_id=thread.id, team_role_ids=[r.id for r in roles])
+            game = DiscordSnakeGame(thread, thread.id, roles, journal, self._role_pool,
+                                    self.stats.for_game(thread.id, guild_id))
+            self._add_game(guild_id, thread.id, game)
+        finally:
+            self._creating[guild_id] -= 1
 
     async def end_game(self, ctx: discord.ApplicationContext):
-        game = self._game_threads[ctx.channel.id]
+        game = self._get_game(ctx)
         if game is None:
             await ctx.respond("No game has been found", ephemeral=True)
             return
@@ -315,14 +753,28 @@ class GameManager:
         except GameError as e:
             await ctx.respond(f"**Error:** {e}", ephemeral=True)
         else:
-            del self._game_threads[ctx.channel.id]
+            del self._games[ctx.guild_id][ctx.channel.id]
+            metrics.remove_game(ctx.channel.id)
+
+    async def route_interaction(self, interaction: discord.Interaction):
+        """Dispatches clicks on challenge buttons, including ones sent before a restart."""
+        if interaction.type is not discord.InteractionType.component or not interaction.custom_id:
+            return
+        ids = parse_challenge_custom_id(interaction.custom_id)
+        if ids is None:
+            return
+        game_id, cycle_id, challenge_id = ids
+        game = self._games.get(interaction.guild_id or 0, {}).get(game_id)
+        if game is None:
+            await interaction.response.send_message("This game has ended", ephemeral=True)
+            return
+        await game._complete_challenge(interaction, challenge_id, cycle_id)
 
     def game_command(self, f: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
         @functools.wraps(f)
         async def magic(ctx: discord.ApplicationContext, *args, **kwargs):
-            try:
-                game = self._game_threads[ctx.channel.id]
-            except KeyError:
+            game = self._get_game(ctx)
+            if game is None:
                 await ctx.respond("This command need to be ran in the general thread for the game.", ephemeral=True)
             else:
                 await f(ctx, game, *args, **kwargs)
@@ -336,8 +788,41 @@ class GameManager:
         return magic
 
 
-game_manager = GameManager()
-bot = discord.Bot()
+def gateway_options(profile: str = os.environ.get("GATEWAY_PROFILE", "lean")) -> dict[str, Any]:
+    """Returns the intents and cache settings of a gateway profile.
+
+    The lean profile only subscribes to guild events: interactions arrive
+    without any intent, and the bot only needs its own threads and the team
+    roles from the guild cache. Members and messages are never cached; the
+    few members the bot needs come with their interactions or are fetched.
+    """
+    if profile == "full":
+        return {}
+    if profile != "lean":
+        raise ValueError(f"Unknown gateway profile {profile!r}")
+    intents = discord.Intents.none()
+    intents.guilds = True
+    return {
+        "intents": intents,
+        "member_cache_flags": discord.MemberCacheFlags.none(),
+        "max_messages": None,
+        "chunk_guilds_at_startup": False,
+    }
+
+
+def make_bot() -> discord.Bot:
+    """Creates an auto-sharded bot when SHARD_COUNT is set, e.g. by launcher.py."""
+    options = gateway_options()
+    if not os.environ.get("SHARD_COUNT"):
+        return discord.Bot(**options)
+    shard_ids = None
+    if os.environ.get("SHARD_IDS"):
+        shard_ids = [int(i) for i in os.environ["SHARD_IDS"].split(",")]
+    return discord.AutoShardedBot(shard_count=int(os.environ["SHARD_COUNT"]), shard_ids=shard_ids, **options)
+
+
+game_manager = GameManager(GUILD_CONFIGS)
+bot = make_bot()
 
 
 @bot.command(guild_ids=GUILD_IDS)
@@ -347,17 +832,31 @@ async def create_game(ctx: discord.ApplicationContext):
 
 @bot.command(guild_ids=GUILD_IDS)
 @game_manager.game_command
-async def start_game(ctx: discord.ApplicationContext, game: DiscordSnakeGame):
-    await game.start_game(ctx)
+@discord.option("seed", int, min_value=0, required=False,
+                description="Draw every cycle up front from this seed, to replay a game")
+async def start_game(ctx: discord.ApplicationContext, game: DiscordSnakeGame, seed: Optional[int]):
+    await game.start_game(ctx, seed)
 
 
 @bot.command(guild_ids=GUILD_IDS)
 @game_manager.game_command
-@discord.option("team_id", int, choices=[1, 2])
+@discord.option("team_id", int, min_value=1, max_value=MAX_TEAMS)
 async def join_game(ctx: discord.ApplicationContext, game: DiscordSnakeGame, team_id: int):
     await game.join_game(ctx, team_id)
 
 
+@bot.command(guild_ids=GUILD_IDS)
+@game_manager.game_command
+async def pause_game(ctx: discord.ApplicationContext, game: DiscordSnakeGame):
+    await game.pause_game(ctx)
+
+
+@bot.command(guild_ids=GUILD_IDS)
+@game_manager.game_command
+async def resume_game(ctx: discord.ApplicationContext, game: DiscordSnakeGame):
+    await game.resume_game(ctx)
+
+
 @bot.command(guild_ids=GUILD_IDS)
 async def end_game(ctx: discord.ApplicationContext):
     await game_manager.end_game(ctx)
@@ -392,12 +891,198 @@ async def cycle_length(ctx: discord.ApplicationContext, game: DiscordSnakeGame,
         await game.set_setting(ctx, "cycle_length", new_val)
 
 
+@settings.command()
+@game_manager.game_command
+@discord.option("new_val", bool, required=False)
+async def combined_broadcast(ctx: discord.ApplicationContext, game: DiscordSnakeGame, new_val: Optional[bool] = None):
+    if new_val is None:
+        val = await game.get_setting("combined_broadcast")
+        await ctx.respond(f"combined_broadcast is set to {val}", ephemeral=True)
+    else:
+        await game.set_setting(ctx, "combined_broadcast", new_val)
+
+
+@settings.command()
+@game_manager.game_command
+@discord.option("new_val", str, required=False, description="Leave empty to allow any category")
+async def category(ctx: discord.ApplicationContext, game: DiscordSnakeGame, new_val: Optional[str] = None):
+    if new_val is None:
+        val = await game.get_setting("category")
+        await ctx.respond(f"category is set to {val}", ephemeral=True)
+    else:
+        await game.set_setting(ctx, "category", new_val)
+
+
+@settings.command()
+@game_manager.game_command
+@discord.option("new_val", str, required=False, description="Leave empty to allow any difficulty")
+async def difficulty(ctx: discord.ApplicationContext, game: DiscordSnakeGame, new_val: Optional[str] = None):
+    if new_val is None:
+        val = await game.get_setting("difficulty")
+        await ctx.respond(f"difficulty is set to {val}", ephemeral=True)
+    else:
+        await game.set_setting(ctx, "difficulty", new_val)
+
+
+@settings.command()
+@game_manager.game_command
+@discord.option("new_val", int, min_value=MIN_TEAMS, max_value=MAX_TEAMS, required=False)
+async def num_teams(ctx: discord.ApplicationContext, game: DiscordSnakeGame, new_val: Optional[int] = None):
+    if new_val is None:
+        val = await game.get_setting("num_teams")
+        await ctx.respond(f"num_teams is set to {val}", ephemeral=True)
+    else:
+        await game.set_setting(ctx, "num_teams", new_val)
+
+
+@settings.command()
+@game_manager.game_command
+@discord.option("new_val", bool, required=False)
+async def weighted(ctx: discord.ApplicationContext, game: DiscordSnakeGame, new_val: Optional[bool] = None):
+    if new_val is None:
+        val = await game.get_setting("weighted")
+        await ctx.respond(f"weighted is set to {val}", ephemeral=True)
+    else:
+        await game.set_setting(ctx, "weighted", new_val)
+
+
 @bot.command(guild_ids=GUILD_IDS)
 async def reload_challenges(ctx: discord.ApplicationContext):
-    load_challenges()
-    await ctx.respond("Challenges reloaded")
+    await ctx.defer()
+    try:
+        catalog = await reload_catalog()
+    except (OSError, CatalogError) as e:
+        await ctx.respond(f"**Error:** Failed to reload challenges: {e}")
+        return
+    refresh_index()
+    await ctx.respond(f"Reloaded {len(catalog)} challenges (version {catalog.version})")
+
+
+challenge = bot.create_group("challenge", "Look up challenges", guild_ids=GUILD_IDS,
+                             default_member_permissions=discord.Permissions(administrator=True))
+
+
+async def complete_challenge_title(ctx: discord.AutocompleteContext) -> list[str]:
+    index = await get_index()
+    # Choices are limited to 25 of at most 100 characters
+    return [c.title[:100] for c in index.search(ctx.value or "", limit=25)]
+
+
+@challenge.command()
+@discord.option("query", str, description="Part of a title or description")
+async def search(ctx: discord.ApplicationContext, query: str):
+    index = await get_index()
+    lines = []
+    for c in index.search(query, limit=10):
+        tags = ", ".join(filter(None, (c.category, c.difficulty)))
+        lines.append(f"- **{c.title}**" + (f" ({tags})" if tags else ""))
+    await ctx.respond("\n".join(lines) or "No challenges found", ephemeral=True)
+
+
+@challenge.command()
+@discord.option("title", str, autocomplete=complete_challenge_title)
+async def preview(ctx: discord.ApplicationContext, title: str):
+    index = await get_index()
+    found = index.find(title) or next(iter(index.search(title, limit=1)), None)
+    if found is None:
+        await ctx.respond(f"**Error:** No challenge is called {title}", ephemeral=True)
+        return
+    details = ", ".join(filter(None, (found.category, found.difficulty, f"weight {found.weight:g}")))
+    await ctx.respond(f"{format_challenge(found)}\n-# {details}", ephemeral=True)
+
+
+@bot.command(guild_ids=GUILD_IDS)
+async def teardown_status(ctx: discord.ApplicationContext):
+    teardown = get_teardown()
+    job = teardown.get(ctx.channel.id)
+    if job is not None:
+        await ctx.respond(f"Clean-up of {job}", ephemeral=True)
+        return
+    running = [str(j) for j in teardown.jobs.values() if not j.finished.is_set()]
+    await ctx.respond("\n".join(running) or "No clean-up is running", ephemeral=True)
+
+
+@bot.command(guild_ids=GUILD_IDS)
+async def leaderboard(ctx: discord.ApplicationContext):
+    players = await asyncio.to_thread(game_manager.stats.leaderboard, ctx.guild_id)
+    lines = [f"{i}. <@{p.player_id}>: {p.completions} completed, {p.average_time:.1f}s on average"
+             for i, p in enumerate(players, 1)]
+    await ctx.respond("\n".join(lines) or "No challenges have been completed yet",
+                      allowed_mentions=discord.AllowedMentions.none())
+
+
+@bot.command(guild_ids=GUILD_IDS)
+@discord.option("challenge", str, required=False, description="Leave empty for the most completed challenges")
+async def solve_times(ctx: discord.ApplicationContext, challenge: Optional[str] = None):
+    challenges = await asyncio.to_thread(game_manager.stats.challenge_stats, ctx.guild_id, challenge)
+    lines = [f"**{c.challenge}**: {c.completions} completed, {c.average_time:.1f}s on average, best {c.best_time:.1f}s"
+             for c in challenges]
+    await ctx.respond("\n".join(lines) or "No matching challenge has been completed yet")
+
+
+_profile_lock = asyncio.Lock()
+
+
+@bot.command(guild_ids=GUILD_IDS)
+@discord.default_permissions(administrator=True)
+@discord.option("seconds", int, min_value=1, max_value=60)
+async def profile(ctx: discord.ApplicationContext, seconds: int):
+    if _profile_lock.locked():
+        await ctx.respond("**Error:** A profile is already running", ephemeral=True)
+        return
+    async with _profile_lock:
+        await ctx.defer(ephemeral=True)
+        stacks = await profile_loop(seconds)
+    await ctx.respond(
+        f"Sampled the event loop for {seconds}s (collapsed stacks, open with flamegraph.pl or speedscope)",
+        file=discord.File(io.BytesIO(stacks.encode()), filename="profile.collapsed"),
+        ephemeral=True)
+
+
+_catalog_watcher: Optional[asyncio.Task] = None
+_metrics_server: Optional[asyncio.Server] = None
+_watchdog: Optional[LoopWatchdog] = None
+
+
+@bot.listen("on_interaction")
+async def route_interaction(interaction: discord.Interaction):
+    await game_manager.route_interaction(interaction)
+
+
+@bot.listen("on_ready")
+async def recover_games():
+    await game_manager.recover(bot)
+
+
+@bot.listen("on_ready")
+async def start_metrics_server():
+    global _metrics_server
+    if os.environ.get("METRICS_PORT") and _metrics_server is None:
+        _metrics_server = await metrics.serve(int(os.environ["METRICS_PORT"]))
+
+
+@bot.listen("on_ready")
+async def start_catalog_watcher():
+    global _catalog_watcher
+    if os.environ.get("WATCH_CHALLENGES") and _catalog_watcher is None:
+        _catalog_watcher = asyncio.create_task(watch_catalog(on_reload=lambda _: refresh_index()))
+
+
+@bot.listen("on_ready")
+async def start_search_index():
+    refresh_index()
+
 
+@bot.listen("on_ready")
+async def start_watchdog():
+    global _watchdog
+    if _watchdog is None:
+        _watchdog = LoopWatchdog(threshold=float(os.environ.get("LOOP_LAG_THRESHOLD", 0.25)))
+        _watchdog.start()
 
 
 if __name__ == "__main__":
-    bot.run(os.environ["DISCORD_TOKEN"])
+    try:
+        bot.run(os.environ["DISCORD_TOKEN"])
+    finally:
+        game_manager.close()
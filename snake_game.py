@@ -1,26 +1,30 @@
 import asyncio
 from collections import deque
-from collections.abc import Callable, Coroutine
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from enum import Enum, auto
 import logging
 import random
-from typing import Any
-from warnings import warn
-import csv
+from typing import Any, Optional
 
+from catalog import Catalog, Challenge, ensure_catalog, get_catalog
+from events import ChallengeCompleted, CycleStarted, CycleWarning, EventBus, GameEnded
+from journal import GameJournal, GameRecord
+from metrics import TICK_LATENESS, timed_lock
+from sampler import Schedule, ShuffleBag, build_bag
+from scheduler import PausableTimer, Scheduler, get_scheduler
+from stats import GameStats
 
-challenges = []
+
+# Cycles of a seeded game drawn when it starts, an hour of 30 second cycles
+SCHEDULE_CYCLES = 120
 
 
 class GameError(RuntimeError):
     pass
 
 
-@dataclass
-class Challenge:
-    title: str
-    description: str
+class ExpiredCycleError(GameError):
+    pass
 
 
 @dataclass
@@ -28,30 +32,33 @@ class Settings:
     cycle_length: int = 30  # TODO: Change to 120
     warning_time: int = 5
     num_challenges: int = 3
-
-
-async def _no_method_warning(*_, **__):
-    warn("A method has not been defined")
-
-
-@dataclass
-class InterfaceMethods:
-    broadcast_challenges: Callable[[int], Coroutine[Any, Any, None]] = _no_method_warning
-    warning_ping: Callable[[], Coroutine[Any, Any, None]] = _no_method_warning
+    # Send all of a cycle's challenges as one message with one button each
+    combined_broadcast: bool = True
+    # Only draw challenges with this category/difficulty when set
+    category: Optional[str] = None
+    difficulty: Optional[str] = None
+    # Draw challenges in proportion to their weight column
+    weighted: bool = False
+    num_teams: int = 2
 
 
 class GameState(Enum):
     INITIAL = auto()
     STARTING = auto()
     PLAYING = auto()
-    PAUSED = auto()  # NOTE: Will not be used in initial implementation
+    PAUSED = auto()
     ENDED = auto()
 
 
 class SnakeGame:
-    def __init__(self, settings: Settings, interface: InterfaceMethods):
+    def __init__(self, settings: Settings, scheduler: Optional[Scheduler] = None,
+                 journal: Optional[GameJournal] = None, stats: Optional[GameStats] = None):
         self._settings = settings
-        self._interface = interface
+        # The game only publishes what happened; delivering it is up to the subscribers
+        self.events = EventBus()
+        self._scheduler = scheduler or get_scheduler()
+        self._journal = journal
+        self._stats = stats
 
         self._state = GameState.INITIAL
         self._state_lock = asyncio.Lock()
@@ -60,13 +67,25 @@ class SnakeGame:
         self._challenge_lock = asyncio.Lock()
         self._cycle_id = 0
         self._set_complete = False
+        # The catalog is only loaded once the first game starts
+        self._catalog: Optional[Catalog] = None
+        self._bag: Optional[ShuffleBag] = None
+        self._last_draw: list[int] = []
+        # Seeded games draw every cycle up front and keep their catalog
+        self.seed: Optional[int] = None
+        self._schedule: Optional[Schedule] = None
 
-        self._challenge_loop_task = None
+        self._timer = PausableTimer(self._scheduler)
+        self._tick_lateness: deque[float] = deque(maxlen=100)
 
     @property
     def has_started(self):
         return self._state is not GameState.INITIAL
 
+    @property
+    def cycle_id(self) -> int:
+        return self._cycle_id
+
     @property
     def is_playing(self):
         return self._state is GameState.PLAYING
@@ -79,94 +98,260 @@ class SnakeGame:
     def has_ended(self):
         return self._state is GameState.ENDED
 
+    @property
+    def tick_lateness(self) -> list[float]:
+        """How late each of the most recent cycle ticks fired, in seconds."""
+        return list(self._tick_lateness)
+
     async def get_current_challenges(self) -> list[Challenge]:
-        async with self._challenge_lock:
+        async with timed_lock(self._challenge_lock, "challenge"):
             return self._challenge_queue[0]
 
     async def get_next_challenges(self):
-        async with self._challenge_lock:
+        async with timed_lock(self._challenge_lock, "challenge"):
             return self._challenge_queue[1]
 
-    async def enter_starting_state(self):
+    def peek_next_cycle(self) -> tuple[int, list[Challenge]]:
+        """Returns the id and the challenges of the cycle after the current one.
+        Nothing is awaited, so the two always belong to the same cycle.
+        """
+        return self._cycle_id + 1, self._challenge_queue[1]
+
+    async def enter_starting_state(self, seed: Optional[int] = None):
         """Enters the STARTING state of the Game. This sets has_started to False.
         This is intended to indicate when Settings should not be changed before the Game starts.
+        Games started with the same seed and catalog get the same challenges in every cycle.
 
         Raises:
-            GameError: Cannot enter starting state from a state other than INITIAL
+            GameError: Cannot enter starting state from a state other than INITIAL,
+                or too few challenges match the settings
         """
-        async with self._state_lock:
+        async with timed_lock(self._state_lock, "state"):
             if self._state is not GameState.INITIAL:
                 raise GameError(
                     "Cannot enter starting state from a state other than INITIAL")
+            await self._prepare_bag()
+            if seed is not None:
+                self._build_schedule(seed)
+            else:
+                self._build_bag()
             self._state = GameState.STARTING
 
     async def start_game(self):
-        async with self._state_lock:
+        """Starts the first cycle.
+
+        Raises:
+            GameError: The game has already started, or too few challenges match the settings
+        """
+        async with timed_lock(self._state_lock, "state"):
             if self._state not in (GameState.INITIAL, GameState.STARTING):
                 raise GameError("Cannot start a game that has not started")
 
-            self._challenge_queue.append(self._generate_challenges())
-            self._challenge_queue.append(self._generate_challenges())
+            if self._schedule is not None:
+                self._challenge_queue.append(self._scheduled_challenges(0))
+                self._challenge_queue.append(self._scheduled_challenges(1))
+            else:
+                if self._bag is None:
+                    await self._prepare_bag()
+                    self._build_bag()
+                self._challenge_queue.append(self._generate_challenges())
+                self._challenge_queue.append(self._generate_challenges())
+
+            self._timer.start()
+            self._schedule_cycle(1)
+            self._state = GameState.PLAYING
+            assert self._catalog is not None
+            self._record("game_started", settings=asdict(self._settings),
+                         challenges=[[asdict(c) for c in cycle] for cycle in self._challenge_queue],
+                         seed=self.seed, catalog=self._catalog.digest)
+            if self._stats is not None:
+                self._stats.game_started(self.seed)
+                self._stats.cycle_started(0)
+            self.events.publish(CycleStarted(0))
+
+    async def restore_game(self, record: GameRecord):
+        """Continues a started game from its journal after a restart. Used instead of start_game.
 
-            self._challenge_loop_task = asyncio.create_task(
-                self._challenge_loop())
+        Raises:
+            GameError: The game has already started
+        """
+        async with timed_lock(self._state_lock, "state"):
+            if self._state is not GameState.INITIAL:
+                raise GameError("Cannot restore a game that has already started")
+
+            catalog = await self._prepare_bag()
+            if record.seed is not None and catalog.digest == record.catalog_digest:
+                self._build_schedule(record.seed)
+            else:
+                if record.seed is not None:
+                    logging.warning(f"The challenges have changed since seeded game {record.game_id} started, "
+                                    "its remaining cycles will differ")
+                self._build_bag()
+            for cycle in record.challenge_queue:
+                self._challenge_queue.append([Challenge(**c) for c in cycle])
+            self._cycle_id = record.cycle_id
+            self._set_complete = record.set_complete
+
+            # Downtime past the end of the current cycle counts as paused time,
+            # so the restored game continues with the next cycle instead of skipping ahead
+            elapsed = min(record.elapsed(),
+                          (record.cycle_id + 1) * self._settings.cycle_length)
+            self._timer.start(elapsed)
+            self._schedule_cycle(record.cycle_id + 1)
+            if record.paused:
+                self._timer.pause()
+                self._state = GameState.PAUSED
+            else:
+                self._state = GameState.PLAYING
+
+    async def pause_game(self):
+        async with timed_lock(self._state_lock, "state"):
+            if self._state is not GameState.PLAYING:
+                raise GameError("Cannot pause a game that is not in progress")
+            self._timer.pause()
+            self._state = GameState.PAUSED
+            self._record("game_paused", elapsed=self._timer.elapsed())
+
+    async def resume_game(self):
+        async with timed_lock(self._state_lock, "state"):
+            if self._state is not GameState.PAUSED:
+                raise GameError("Cannot resume a game that is not paused")
+            self._timer.resume()
             self._state = GameState.PLAYING
+            self._record("game_resumed", elapsed=self._timer.elapsed())
 
     async def end_game(self):
-        async with self._state_lock:
-            if self._state is not GameState.PLAYING:
+        async with timed_lock(self._state_lock, "state"):
+            if self._state not in (GameState.PLAYING, GameState.PAUSED):
                 raise GameError("Cannot end a game that is not active")
-            assert self._challenge_loop_task is not None
-            self._challenge_loop_task.cancel()
+            self._timer.cancel_all()
             self._state = GameState.ENDED
+            self._record("game_ended")
+            if self._stats is not None:
+                self._stats.game_ended()
+            self.events.publish(GameEnded(self._cycle_id))
 
-    async def complete_challenge(self, challenge_id: int, cycle_id: int) -> tuple[Challenge, list[Challenge]]:
-        async with self._challenge_lock:
-            if self._state is not GameState.PLAYING:
-                raise GameError("Game is currently not in progress")
-            if self._cycle_id != cycle_id:
-                raise GameError(
-                    "Cannot complete a challenge from an expired cycle")
-            if self._set_complete:
-                raise GameError(
-                    "A challenge has already been completed for this cycle")
-            if not 0 <= challenge_id < self._settings.num_challenges:
-                raise GameError("Invalid challenge ID")
-
-            completed_challenge = self._challenge_queue[0][challenge_id]
-            next_challenges = self._challenge_queue[1]
-            self._set_complete = True
-            return completed_challenge, next_challenges
-
-    def _generate_challenges(self) -> list[Challenge]:
-        return random.sample(challenges, k=self._settings.num_challenges)
-
-    async def _shift_challenges(self):
-        async with self._challenge_lock:
-            self._challenge_queue.append(self._generate_challenges())
-            self._cycle_id += 1
-            self._set_complete = False
-
-    async def _challenge_loop(self):
-        while True:
-            # TODO: change this to a pausable timer (will not be done in initial implementation)
-            if self._settings.cycle_length > self._settings.warning_time:
-                await asyncio.sleep(self._settings.cycle_length - self._settings.warning_time)
-                asyncio.create_task(self._interface.warning_ping())
-                await asyncio.sleep(self._settings.warning_time)
-            else:
-                await asyncio.sleep(self._settings.cycle_length)
-            await self._shift_challenges()
-            await self._interface.broadcast_challenges(self._cycle_id)
+    def is_cycle_open(self, cycle_id: int) -> bool:
+        return self._state is GameState.PLAYING and self._cycle_id == cycle_id and not self._set_complete
 
+    def complete_challenge(self, challenge_id: int, cycle_id: int, player_id: Optional[int] = None,
+                           team_id: Optional[int] = None) -> tuple[Challenge, list[Challenge]]:
+        """Completes a challenge of the current cycle. Only the first call per cycle succeeds.
 
-def load_challenges():
-    global challenges
-    challenges = []
-    with open("challenges.csv", newline='') as f:
-        for row in csv.DictReader(f):
-            challenges.append(Challenge(row["title"], row["description"]))
-    logging.info(f"Loaded {len(challenges)} challenges!")
+        This never awaits, so checking and setting (cycle_id, set_complete) is a single
+        atomic compare-and-set on the event loop and losing clicks are rejected immediately.
 
+        Raises:
+            GameError: The challenge cannot be completed
+        """
+        if self._state is not GameState.PLAYING:
+            raise GameError("Game is currently not in progress")
+        if self._cycle_id != cycle_id:
+            raise ExpiredCycleError(
+                "Cannot complete a challenge from an expired cycle")
+        if self._set_complete:
+            raise GameError(
+                "A challenge has already been completed for this cycle")
+        if not 0 <= challenge_id < self._settings.num_challenges:
+            raise GameError("Invalid challenge ID")
+
+        completed_challenge = self._challenge_queue[0][challenge_id]
+        next_challenges = self._challenge_queue[1]
+        self._set_complete = True
+        self._record("challenge_completed", cycle_id=cycle_id, challenge_id=challenge_id,
+                     player_id=player_id, team_id=team_id)
+        if self._stats is not None:
+            # Measured on the game clock, so time spent paused does not count
+            solve_time = self._timer.elapsed() - cycle_id * self._settings.cycle_length
+            self._stats.challenge_completed(cycle_id, completed_challenge.title, team_id, player_id, solve_time)
+        self.events.publish(ChallengeCompleted(
+            cycle_id, challenge_id, completed_challenge, next_challenges, player_id, team_id))
+        return completed_challenge, next_challenges
+
+    def _record(self, event: str, **data: Any):
+        if self._journal is not None:
+            self._journal.record(event, **data)
+
+    async def _prepare_bag(self) -> Catalog:
+        # Loading the catalog and building what bags over it share are both
+        # O(n), so they run in a worker thread; `_build_bag` then finds them cached
+        catalog = await ensure_catalog()
+        await asyncio.to_thread(catalog.pool.bag_source, self._settings.weighted,
+                                category=self._settings.category, difficulty=self._settings.difficulty)
+        return catalog
+
+    def _build_bag(self, rng: Optional[random.Random] = None):
+        catalog = get_catalog()
+        bag = build_bag(catalog.pool, weighted=self._settings.weighted, rng=rng,
+                        category=self._settings.category,
+                        difficulty=self._settings.difficulty)
+        if len(bag) < self._settings.num_challenges:
+            raise GameError(
+                f"Only {len(bag)} challenges match the current settings, but {self._settings.num_challenges} are needed")
+        self._catalog = catalog
+        self._bag = bag
+        self._last_draw = []
+
+    def _build_schedule(self, seed: int):
+        self._build_bag(random.Random(seed))
+        assert self._bag is not None
+        self._schedule = Schedule(self._bag, self._settings.num_challenges, SCHEDULE_CYCLES)
+        self.seed = seed
+
+    def _scheduled_challenges(self, cycle_id: int) -> list[Challenge]:
+        assert self._schedule is not None and self._catalog is not None
+        return [self._catalog.pool[i] for i in self._schedule.cycle(cycle_id)]
+
+    def _refresh_catalog(self):
+        # Games keep drawing from their snapshot until the cycle after a reload
+        assert self._catalog is not None
+        if get_catalog().version == self._catalog.version:
+            return
+        try:
+            # Cheap on a tick: reload_catalog built the new pool's bag sources
+            self._build_bag()
+        except GameError as e:
+            logging.warning(f"Keeping catalog version {self._catalog.version}: {e}")
 
-load_challenges()
+    def _generate_challenges(self) -> list[Challenge]:
+        assert self._bag is not None and self._catalog is not None
+        self._last_draw = self._bag.draw_many(
+            self._settings.num_challenges, exclude=self._last_draw)
+        return [self._catalog.pool[i] for i in self._last_draw]
+
+    def _shift_challenges(self):
+        if self._schedule is not None:
+            # The indices into the pinned catalog are already drawn
+            self._challenge_queue.append(self._scheduled_challenges(self._cycle_id + 2))
+        else:
+            self._refresh_catalog()
+            self._challenge_queue.append(self._generate_challenges())
+        self._cycle_id += 1
+        self._set_complete = False
+        self._record("cycle_shifted", cycle_id=self._cycle_id,
+                     challenges=[asdict(c) for c in self._challenge_queue[1]])
+        if self._stats is not None:
+            self._stats.cycle_started(self._cycle_id)
+
+    def _schedule_cycle(self, cycle: int):
+        # Deadlines are measured from the start of the game rather than from the
+        # previous tick, so time spent broadcasting never delays later cycles
+        cycle_end = cycle * self._settings.cycle_length
+        if self._settings.cycle_length > self._settings.warning_time:
+            self._timer.call_at(
+                cycle_end - self._settings.warning_time, self._on_warning)
+        self._timer.call_at(cycle_end, self._on_tick, cycle, cycle_end)
+
+    def _on_warning(self):
+        self.events.publish(CycleWarning(self._cycle_id + 1))
+
+    def _on_tick(self, cycle: int, deadline: float):
+        lateness = self._timer.lateness(deadline)
+        self._tick_lateness.append(lateness)
+        TICK_LATENESS.observe(lateness)
+        if lateness > 1:
+            logging.warning(f"Cycle {cycle} ticked {lateness:.3f}s late")
+
+        self._schedule_cycle(cycle + 1)
+        self._shift_challenges()
+        self.events.publish(CycleStarted(self._cycle_id))
@@ -0,0 +1,169 @@
+from collections import defaultdict
+import contextlib
+from dataclasses import dataclass
+import os
+import sqlite3
+import time
+from typing import Any, ContextManager, Optional
+
+from batch_writer import BatchWriter
+
+
+STATS_PATH = os.environ.get("SNAKE_STATS", "snake_stats.db")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY, guild_id INTEGER NOT NULL, seed INTEGER,
+    started_at REAL NOT NULL, ended_at REAL);
+CREATE TABLE IF NOT EXISTS cycles (
+    game_id INTEGER NOT NULL, cycle_id INTEGER NOT NULL, started_at REAL NOT NULL,
+    PRIMARY KEY (game_id, cycle_id)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS completions (
+    id INTEGER PRIMARY KEY, game_id INTEGER NOT NULL, cycle_id INTEGER NOT NULL,
+    guild_id INTEGER NOT NULL, challenge TEXT NOT NULL, team_id INTEGER, player_id INTEGER,
+    solve_time REAL NOT NULL, completed_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS completions_game ON completions (game_id, cycle_id);
+CREATE INDEX IF NOT EXISTS completions_challenge ON completions (guild_id, challenge);
+
+-- Running totals, updated with every batch of completions so that queries
+-- never scan the completions table
+CREATE TABLE IF NOT EXISTS player_totals (
+    guild_id INTEGER NOT NULL, player_id INTEGER NOT NULL,
+    completions INTEGER NOT NULL, solve_time REAL NOT NULL,
+    PRIMARY KEY (guild_id, player_id)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS player_totals_rank ON player_totals (guild_id, completions DESC);
+CREATE TABLE IF NOT EXISTS challenge_totals (
+    guild_id INTEGER NOT NULL, challenge TEXT NOT NULL,
+    completions INTEGER NOT NULL, solve_time REAL NOT NULL, best_time REAL NOT NULL,
+    PRIMARY KEY (guild_id, challenge)) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS challenge_totals_rank ON challenge_totals (guild_id, completions DESC);
+"""
+
+_INSERTS = {
+    "game_started": "INSERT OR REPLACE INTO games (id, guild_id, seed, started_at) VALUES (?, ?, ?, ?)",
+    "game_ended": "UPDATE games SET ended_at = ? WHERE id = ?",
+    "cycle_started": "INSERT OR REPLACE INTO cycles VALUES (?, ?, ?)",
+    "challenge_completed": "INSERT INTO completions (game_id, cycle_id, guild_id, challenge, team_id, "
+                           "player_id, solve_time, completed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+}
+
+
+@dataclass
+class PlayerStats:
+    player_id: int
+    completions: int
+    average_time: float
+
+
+@dataclass
+class ChallengeStats:
+    challenge: str
+    completions: int
+    average_time: float
+    best_time: float
+
+
+class StatsStore(BatchWriter):
+    """Completion statistics in an SQLite database.
+
+    Writes are queued and committed in batches by a background thread, so
+    recording never waits for the disk. Queries read precomputed totals and
+    should be run off the event loop.
+    """
+
+    thread_name = "stats-writer"
+
+    def __init__(self, path: str = STATS_PATH, batch_interval: float = 0.5):
+        super().__init__(path, batch_interval)
+
+    def for_game(self, game_id: int, guild_id: int) -> "GameStats":
+        return GameStats(self, game_id, guild_id)
+
+    def record(self, kind: str, *row: Any):
+        self._put((kind, row))
+
+    def start(self):
+        # The schema is created once, here, rather than by every connection
+        with contextlib.closing(self._connect()) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+        super().start()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _open_writer(self) -> ContextManager[Any]:
+        return contextlib.closing(self._connect())
+
+    def _write_batch(self, db: Any, batch: list[tuple[str, tuple[Any, ...]]]):
+        rows: dict[str, list[tuple[Any, ...]]] = defaultdict(list)
+        for kind, row in batch:
+            rows[kind].append(row)
+
+        # Each player and challenge is updated once per batch
+        players: dict[tuple[int, int], list[float]] = defaultdict(lambda: [0, 0.0])
+        challenges: dict[tuple[int, str], list[float]] = defaultdict(lambda: [0, 0.0, float("inf")])
+        for _, _, guild_id, challenge, _, player_id, solve_time, _ in rows["challenge_completed"]:
+            if player_id is not None:
+                totals = players[guild_id, player_id]
+                totals[0] += 1
+                totals[1] += solve_time
+            totals = challenges[guild_id, challenge]
+            totals[0] += 1
+            totals[1] += solve_time
+            totals[2] = min(totals[2], solve_time)
+
+        with db:
+            for kind, statement in _INSERTS.items():
+                if rows[kind]:
+                    db.executemany(statement, rows[kind])
+            db.executemany(
+                "INSERT INTO player_totals VALUES (?, ?, ?, ?) ON CONFLICT DO UPDATE SET "
+                "completions = completions + excluded.completions, solve_time = solve_time + excluded.solve_time",
+                ((*key, *totals) for key, totals in players.items()))
+            db.executemany(
+                "INSERT INTO challenge_totals VALUES (?, ?, ?, ?, ?) ON CONFLICT DO UPDATE SET "
+                "completions = completions + excluded.completions, solve_time = solve_time + excluded.solve_time, "
+                "best_time = min(best_time, excluded.best_time)",
+                ((*key, *totals) for key, totals in challenges.items()))
+
+    def leaderboard(self, guild_id: int, limit: int = 10) -> list[PlayerStats]:
+        """The players of a guild with the most completions."""
+        with contextlib.closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT player_id, completions, solve_time / completions FROM player_totals "
+                "WHERE guild_id = ? ORDER BY completions DESC LIMIT ?", (guild_id, limit)).fetchall()
+        return [PlayerStats(*row) for row in rows]
+
+    def challenge_stats(self, guild_id: int, challenge: Optional[str] = None,
+                        limit: int = 10) -> list[ChallengeStats]:
+        """The solve times of one challenge, or of a guild's most completed challenges."""
+        query = "SELECT challenge, completions, solve_time / completions, best_time FROM challenge_totals "
+        with contextlib.closing(self._connect()) as db:
+            if challenge is not None:
+                rows = db.execute(query + "WHERE guild_id = ? AND challenge = ?", (guild_id, challenge)).fetchall()
+            else:
+                rows = db.execute(query + "WHERE guild_id = ? ORDER BY completions DESC LIMIT ?",
+                                  (guild_id, limit)).fetchall()
+        return [ChallengeStats(*row) for row in rows]
+
+
+class GameStats:
+    def __init__(self, store: StatsStore, game_id: int, guild_id: int):
+        self._store = store
+        self.game_id = game_id
+        self.guild_id = guild_id
+
+    def game_started(self, seed: Optional[int] = None):
+        self._store.record("game_started", self.game_id, self.guild_id, seed, time.time())
+
+    def game_ended(self):
+        self._store.record("game_ended", time.time(), self.game_id)
+
+    def cycle_started(self, cycle_id: int):
+        self._store.record("cycle_started", self.game_id, cycle_id, time.time())
+
+    def challenge_completed(self, cycle_id: int, challenge: str, team_id: Optional[int],
+                            player_id: Optional[int], solve_time: float):
+        self._store.record("challenge_completed", self.game_id, cycle_id, self.guild_id, challenge,
+                           team_id, player_id, solve_time, time.time())
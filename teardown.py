@@ -0,0 +1,130 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+import logging
+import random
+from typing import Any, Optional
+
+import discord
+
+from metrics import DISCORD_LATENCY, TEARDOWN_OPERATIONS
+from outbox import TokenBucket
+
+
+class TeardownJob:
+    def __init__(self, key: int, name: str, total: int):
+        self.key = key
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.finished = asyncio.Event()
+        if total == 0:
+            self.finished.set()
+
+    @property
+    def pending(self) -> int:
+        return self.total - self.done - self.failed
+
+    def __str__(self) -> str:
+        status = "done" if self.finished.is_set() else "in progress"
+        failed = f", {self.failed} failed" if self.failed else ""
+        return f"{self.name}: {self.done}/{self.total} {status}{failed}"
+
+
+class Teardown:
+    """Runs clean-up API calls for ended games in the background.
+
+    All games share one concurrency limit and one token bucket, so ending a
+    big game, or several at once, cannot starve the games that are still
+    running. Failed calls are retried with exponential backoff.
+    """
+
+    MAX_FINISHED_JOBS = 100
+
+    def __init__(self, concurrency: int = 4, rate: int = 10, per: float = 1,
+                 max_attempts: int = 5, base_delay: float = 1, max_delay: float = 60):
+        self._slots = asyncio.Semaphore(concurrency)
+        self._bucket = TokenBucket(rate, per)
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self.jobs: dict[int, TeardownJob] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def submit(self, key: int, name: str, calls: list[Callable[[], Awaitable[Any]]]) -> TeardownJob:
+        """Schedules `calls` and returns right away with a job to follow their progress."""
+        self._prune()
+        job = self.jobs[key] = TeardownJob(key, name, len(calls))
+        for call in calls:
+            task = asyncio.create_task(self._run(job, call))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, key: int) -> Optional[TeardownJob]:
+        return self.jobs.get(key)
+
+    async def join(self):
+        while self._tasks:
+            await asyncio.gather(*self._tasks)
+
+    def _prune(self):
+        finished = [k for k, j in self.jobs.items() if j.finished.is_set()]
+        for key in finished[:max(0, len(finished) - self.MAX_FINISHED_JOBS + 1)]:
+            del self.jobs[key]
+
+    async def _run(self, job: TeardownJob, call: Callable[[], Awaitable[Any]]):
+        async with self._slots:
+            if await self._call(call):
+                job.done += 1
+            else:
+                job.failed += 1
+        if job.pending == 0:
+            job.finished.set()
+            logging.info(f"Teardown finished: {job}")
+
+    async def _call(self, call: Callable[[], Awaitable[Any]]) -> bool:
+        operation = getattr(call, "func", call).__name__
+        for attempt in range(self._max_attempts):
+            await self._bucket.acquire()
+            try:
+                with DISCORD_LATENCY.time(operation=operation):
+                    await call()
+            except (discord.Forbidden, discord.NotFound) as e:
+                # Retrying cannot help, e.g. the member left or the thread is gone
+                logging.warning(f"Teardown {operation} failed: {e}")
+                TEARDOWN_OPERATIONS.inc(result="failed")
+                return False
+            except discord.HTTPException as e:
+                if attempt == self._max_attempts - 1:
+                    logging.error(f"Teardown {operation} failed after {self._max_attempts} attempts: {e}")
+                    TEARDOWN_OPERATIONS.inc(result="failed")
+                    return False
+                TEARDOWN_OPERATIONS.inc(result="retried")
+                await asyncio.sleep(self._backoff(attempt, e))
+            else:
+                TEARDOWN_OPERATIONS.inc(result="ok")
+                return True
+        return False
+
+    def _backoff(self, attempt: int, error: discord.HTTPException) -> float:
+        retry_after = None
+        headers = getattr(error.response, "headers", None)
+        if error.status == 429 and headers is not None:
+            try:
+                retry_after = float(headers.get("Retry-After", ""))
+            except ValueError:
+                pass
+        delay = min(self._max_delay, self._base_delay * 2 ** attempt)
+        # Jitter keeps calls that failed together from retrying together
+        return max(retry_after or 0, delay * random.uniform(0.5, 1))
+
+
+_teardown: Optional[Teardown] = None
+
+
+def get_teardown() -> Teardown:
+    global _teardown
+    if _teardown is None:
+        _teardown = Teardown()
+    return _teardown
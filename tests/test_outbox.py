@@ -0,0 +1,43 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from outbox import Outbox  # noqa: E402
+
+
+class FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.sent: list[str] = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content)
+        return content
+
+
+def test_sequential_sends_are_throttled():
+    async def run() -> float:
+        outbox = Outbox(channel_rate=2, channel_per=0.2)
+        channel = FakeChannel(1)
+        start = time.monotonic()
+        for i in range(6):
+            await outbox.send(channel, str(i))
+        assert channel.sent == [str(i) for i in range(6)]
+        return time.monotonic() - start
+
+    # 2 sends from the full bucket, then one every 0.1s
+    assert asyncio.run(run()) >= 0.35
+
+
+def test_bucket_is_dropped_once_refilled():
+    async def run():
+        outbox = Outbox(channel_rate=2, channel_per=0.2)
+        await outbox.send(FakeChannel(1), "hello")
+        assert 1 in outbox._buckets
+        await asyncio.sleep(0.15)
+        assert 1 not in outbox._buckets
+
+    asyncio.run(run())
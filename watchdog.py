@@ -0,0 +1,95 @@
+import asyncio
+from collections import Counter
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from types import FrameType
+from typing import Optional
+
+from metrics import LOOP_LAG, LOOP_STALLS
+
+
+class LoopWatchdog:
+    """Measures event loop lag and logs the stack of whatever blocks the loop.
+
+    A heartbeat task measures how late its sleeps wake up. A separate thread
+    checks the heartbeat, and once it is older than `threshold` it captures
+    the event loop thread's stack, which is the code that is blocking it.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._monitor: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self.loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        self._monitor = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True)
+        self._monitor.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+
+    async def _heartbeat(self):
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._last_beat = now = time.monotonic()
+            LOOP_LAG.observe(max(0.0, now - before - self.interval))
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stopped.wait(self.interval / 2):
+            beat = self._last_beat
+            blocked_for = time.monotonic() - beat
+            if blocked_for < self.threshold or beat == reported_beat:
+                continue
+            # Only report each stall once
+            reported_beat = beat
+            LOOP_STALLS.inc()
+            frame = sys._current_frames().get(self.loop_thread_id or 0)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<unavailable>\n"
+            logging.warning(
+                f"Event loop blocked for at least {blocked_for:.3f}s in:\n{stack}")
+
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(thread_id: int, duration: float, interval: float = 0.005) -> str:
+    """Samples a thread's stack for `duration` seconds.
+
+    Returns the samples in the collapsed stack format used by flamegraph.pl
+    and speedscope: one "outer;...;inner count" line per distinct stack.
+    """
+    samples: Counter[str] = Counter()
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        frame = sys._current_frames().get(thread_id)
+        names = []
+        while frame is not None:
+            names.append(_frame_name(frame).replace(";", ":"))
+            frame = frame.f_back
+        if names:
+            samples[";".join(reversed(names))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+async def profile_loop(duration: float, interval: float = 0.005) -> str:
+    """Samples the event loop thread from a worker thread while the loop keeps running."""
+    return await asyncio.to_thread(sample_stacks, threading.get_ident(), duration, interval)